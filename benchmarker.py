@@ -1,9 +1,530 @@
+import asyncio
+import json
+import random
+from io import BytesIO
+import sys
 import time
+import tracemalloc
+from aiohttp import web
 from minesweeper import MineSweeper
+from mirai import At, Face, Plain, MessageChain
+from mirai import Mirai, Group, Member, InternalEvent
+from mirai.entities.builtins import ExecutorProtocol
+from mirai.misc import argument_signature
+from mirai.codec import BACKENDS, available_backends
+from mirai.command import CommandRouter
+from mirai.event.message.encoder import encode_chain
+from mirai.event.message.models import GroupMessage
+from mirai.image import IOImage
+from mirai.network import fetch, PooledFetch
+from mirai.polling import PollingScheduler
 
-if __name__ == '__main__':
+GAME_SIZES = ((10, 10, 10), (16, 16, 40), (26, 26, 100))
+
+
+def bench_mine():
     start = time.time()
     for i in range(0, 300):
         mine = MineSweeper(25, 25, 25)
         mine.mine(5, 10)
     print(time.time() - start)
+
+
+def bench_gen_mine(games: int = 100):
+    # 接近 row * column - 1 的高密度游戏盘
+    start = time.time()
+    for i in range(0, games):
+        mine = MineSweeper(26, 26, 26 * 26 - 1, rand=random.Random(i))
+        mine.mine(13, 13)
+    print(f"gen_mine 26x26 with {26 * 26 - 1} mines x{games}: {time.time() - start:.4f}s")
+
+
+def bench_render(frames: int = 10):
+    full = MineSweeper(26, 26, 100, rand=random.Random(0))
+    incremental = MineSweeper(26, 26, 100, rand=random.Random(0), incremental_render=True)
+    incremental.draw_panel()
+    rand = random.Random(1)
+    full_spend = incremental_spend = 0
+    for i in range(0, frames):
+        row, column = rand.randrange(26), rand.randrange(26)
+        for mine in (full, incremental):
+            try:
+                mine.tag(row, column)
+            except ValueError:
+                pass
+        start = time.time()
+        full_img = full.draw_panel()
+        full_spend += time.time() - start
+        start = time.time()
+        incremental_img = incremental.draw_panel()
+        incremental_spend += time.time() - start
+        assert full_img.tobytes() == incremental_img.tobytes()
+    print(f"render 26x26 x{frames}: full {full_spend:.4f}s, incremental {incremental_spend:.4f}s")
+
+
+def scan_count_around(mine: MineSweeper, row: int, column: int) -> int:
+    """旧版 count_around 的逐次扫描实现, 仅用于对比"""
+    count = 0
+    for r in range(row - 1, row + 2):
+        for c in range(column - 1, column + 2):
+            if r < 0 or c < 0 or r > mine.row - 1 or c > mine.column - 1:
+                continue
+            if r == row and c == column:
+                continue
+            if mine.panel[r][c].is_mine:
+                count += 1
+    return count
+
+
+def bench_count_around(rounds: int = 50):
+    mine = MineSweeper(26, 26, 100)
+    mine.mine(0, 0)
+    cells = [(r, c) for r in range(mine.row) for c in range(mine.column)]
+    for r, c in cells:
+        assert scan_count_around(mine, r, c) == mine.count_around(r, c)
+    start = time.time()
+    for i in range(0, rounds):
+        for r, c in cells:
+            scan_count_around(mine, r, c)
+    scan = time.time() - start
+    start = time.time()
+    for i in range(0, rounds):
+        for r, c in cells:
+            mine.count_around(r, c)
+    precomputed = time.time() - start
+    print(f"count_around 26x26 x{rounds}: scan {scan:.4f}s, precomputed {precomputed:.4f}s")
+
+
+def bench_memory(games: int = 200):
+    for row, column, mines in GAME_SIZES:
+        for compact in (False, True):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            hold = []
+            for i in range(0, games):
+                mine = MineSweeper(row, column, mines, compact=compact)
+                hold.append(mine)
+            after = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"memory {row}x{column} compact={compact}: {(after - before) / games:.0f} bytes/game")
+            del hold
+
+
+async def start_stub_server(routes):
+    """本地的 mirai-api-http 替身, routes 为 [(method, path, handler)], 返回 (runner, baseurl)"""
+    app = web.Application()
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+async def send_message_stub(request: web.Request):
+    await request.read()
+    return web.json_response({"code": 0, "msg": "success", "messageId": 1})
+
+
+async def bench_http_async(requests: int):
+    runner, baseurl = await start_stub_server([("POST", "/sendGroupMessage", send_message_stub)])
+    url = f"{baseurl}/sendGroupMessage"
+    data = {"sessionKey": "benchmark", "target": 1, "messageChain": [{"type": "Plain", "text": "m d AA"}]}
+    pool = await PooledFetch().open()
+    try:
+        for name, client in (("per-call session", fetch), ("pooled session", pool)):
+            start = time.time()
+            for i in range(0, requests):
+                await client.http_post(url, data)
+            spend = time.time() - start
+            print(f"http {name}: {requests / spend:.0f} req/s")
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+
+def bench_http(requests: int = 500):
+    asyncio.run(bench_http_async(requests))
+
+
+async def upload_stub(request: web.Request):
+    # 分块读取后丢弃, 不让替身服务器自己的内存占用影响统计
+    async for chunk in request.content.iter_chunked(65536):
+        pass
+    return web.json_response({"imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.mirai"})
+
+
+async def bench_upload_memory_async():
+    runner, baseurl = await start_stub_server([("POST", "/uploadImage", upload_stub)])
+    url = f"{baseurl}/uploadImage"
+    mine = MineSweeper(26, 26, 100, rand=random.Random(0))
+    byte_io = BytesIO()
+    mine.draw_panel().save(byte_io, format="png")
+    image = IOImage(byte_io)
+    pool = await PooledFetch().open()
+    try:
+        for name in ("render", "open"):
+            tracemalloc.start()
+            if name == "render":
+                await pool.upload(url, image.render(), {"type": "group"})
+            else:
+                with image.open() as source:
+                    await pool.upload(url, source, {"type": "group"})
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"upload {len(byte_io.getbuffer())} bytes board via {name}(): peak {peak} bytes")
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+
+def bench_upload_memory():
+    asyncio.run(bench_upload_memory_async())
+
+
+def bench_encode_chain(rounds: int = 2000):
+    help_text = "欢迎游玩扫雷小游戏\n输入 【m 开始】 即可开始游戏\n使用 【m help】 来查看帮助"
+    chains = [
+        [At(10001), Plain(help_text)],
+        [At(10001), Plain("你已经在游戏中了"), Face(faceId=14, name="微笑")],
+        MessageChain.parse_obj([
+            {"type": "Plain", "text": "m d AA"},
+            {"type": "Image", "imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.mirai", "url": None}
+        ])
+    ]
+    for chain in chains:
+        assert encode_chain(chain) == [json.loads(i.json()) for i in chain]
+    start = time.time()
+    for i in range(0, rounds):
+        for chain in chains:
+            [json.loads(i.json()) for i in chain]
+    round_trip = time.time() - start
+    start = time.time()
+    for i in range(0, rounds):
+        for chain in chains:
+            encode_chain(chain)
+    direct = time.time() - start
+    print(f"encode {len(chains)} chains x{rounds}: json round-trip {round_trip:.4f}s, direct {direct:.4f}s")
+
+
+def sample_group_traffic(count: int, seed: int = 0):
+    """按群聊中常见的消息构成生成的 GroupMessage 原始数据, 只有少数是 m 开头的命令"""
+    rand = random.Random(seed)
+    sender = {"id": 10001, "memberName": "player", "permission": "MEMBER",
+              "group": {"id": 20001, "name": "group", "permission": "MEMBER"}}
+    traffic = []
+    for i in range(0, count):
+        chain = [{"type": "Source", "id": i, "time": 1600000000 + i}]
+        kind = rand.random()
+        if kind < 0.1:
+            chain.append({"type": "Plain", "text": "m d " + " ".join(
+                rand.choice("ABCDEFGHIJ") + rand.choice("ABCDEFGHIJ") for _ in range(rand.randint(1, 4)))})
+        elif kind < 0.4:
+            chain.append({"type": "At", "target": 10002, "display": "@someone"})
+            chain.append({"type": "Plain", "text": " 今天玩什么"})
+        elif kind < 0.6:
+            chain.append({"type": "Image", "imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.mirai",
+                          "url": "http://gchat.qpic.cn/gchatpic_new/0/0-0-01E9451B70EDEAE3B37C101F1EEBF5B5/0"})
+        elif kind < 0.7:
+            chain.append({"type": "Face", "faceId": 14, "name": "微笑"})
+            chain.append({"type": "Plain", "text": "哈哈哈"})
+        else:
+            chain.append({"type": "Plain", "text": "这局好难啊" * rand.randint(1, 5)})
+        traffic.append({"type": "GroupMessage", "messageChain": chain, "sender": sender})
+    return traffic
+
+
+def bench_parse_chain(count: int = 5000):
+    traffic = json.dumps(sample_group_traffic(count))
+    spend = {}
+    for name, parse in (("eager", MessageChain.parse_obj), ("lazy", MessageChain.lazy)):
+        # 每次都从 JSON 文本重新开始, 与从 websocket 收到消息时一致
+        messages = json.loads(traffic)
+        start = time.time()
+        commands = 0
+        for data in messages:
+            data["messageChain"] = parse(data["messageChain"])
+            message = GroupMessage.parse_obj(data)
+            plain = message.messageChain.getFirstComponent(Plain)
+            if plain is not None and plain.text[:1] == "m":
+                commands += 1
+        spend[name] = (time.time() - start, commands)
+    assert spend["eager"][1] == spend["lazy"][1]
+    print(f"parse {count} group messages: eager {count / spend['eager'][0]:.0f} msg/s, "
+          f"lazy {count / spend['lazy'][0]:.0f} msg/s")
+
+
+def bench_json(count: int = 5000):
+    # websocket 推送的单条消息, fetchMessage 的整批响应, 以及发送消息的请求体
+    frames = [json.dumps(i, ensure_ascii=False) for i in sample_group_traffic(count)]
+    batch = json.dumps({"code": 0, "data": sample_group_traffic(count, seed=1)}, ensure_ascii=False)
+    sends = [{"sessionKey": "benchmark", "target": 20001, "messageChain": encode_chain([At(10001), Plain(f"m d A{i % 10}")])}
+             for i in range(0, count)]
+    for name in available_backends():
+        loads, dumps = BACKENDS[name]
+        assert [loads(i) for i in frames[:100]] == [json.loads(i) for i in frames[:100]]
+        start = time.time()
+        for frame in frames:
+            loads(frame)
+        frame_spend = time.time() - start
+        start = time.time()
+        loads(batch)
+        batch_spend = time.time() - start
+        start = time.time()
+        for data in sends:
+            dumps(data)
+        dumps_spend = time.time() - start
+        print(f"json {name}: {count} frames {frame_spend:.4f}s, batch of {count} {batch_spend:.4f}s, "
+              f"{count} send bodies {dumps_spend:.4f}s")
+
+
+class FetchMessageStub:
+    """按时间注入消息的 fetchMessage 替身, 记录每条消息进入服务端的时间"""
+
+    def __init__(self):
+        self.pending = []
+        self.injected = {}
+
+    def inject(self, data: dict):
+        self.injected[data["messageChain"][0]["id"]] = time.monotonic()
+        self.pending.append(data)
+
+    async def fetch_message(self, request: web.Request):
+        count = int(request.query["count"])
+        data, self.pending[:count] = self.pending[:count], []
+        return web.json_response({"code": 0, "data": data})
+
+    @staticmethod
+    async def auth(request: web.Request):
+        return web.json_response({"code": 0, "session": "benchmark"})
+
+    @staticmethod
+    async def success(request: web.Request):
+        return web.json_response({"code": 0, "msg": "success"})
+
+
+async def inject_traffic(stub: FetchMessageStub, traffic: list, seed: int):
+    # 空闲, 零星消息和突发的大量消息交替出现
+    rand = random.Random(seed)
+    index = 0
+    while index < len(traffic):
+        kind = rand.random()
+        if kind < 0.1:
+            await asyncio.sleep(rand.uniform(0.3, 1.5))
+        elif kind < 0.2:
+            for i in range(0, rand.randint(10, 50)):
+                if index < len(traffic):
+                    stub.inject(traffic[index])
+                    index += 1
+            await asyncio.sleep(0.01)
+        else:
+            stub.inject(traffic[index])
+            index += 1
+            await asyncio.sleep(rand.expovariate(20))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def bench_polling_async(count: int):
+    stub = FetchMessageStub()
+    runner, baseurl = await start_stub_server([
+        ("POST", "/auth", stub.auth),
+        ("POST", "/verify", stub.success),
+        ("POST", "/release", stub.success),
+        ("GET", "/fetchMessage", stub.fetch_message)
+    ])
+    schedulers = {
+        # 与原来固定 0.5 秒, 每次 10 条的轮询相同
+        "fixed 0.5s": PollingScheduler(min_interval=0.5, max_interval=0.5, min_count=10, max_count=10),
+        "adaptive": PollingScheduler(),
+        # 空闲时请求更少, 但空闲后第一批消息的延迟更高
+        "adaptive max 1s": PollingScheduler(max_interval=1.0)
+    }
+    try:
+        for name, scheduler in schedulers.items():
+            app = Mirai(baseurl.replace("http://", "mirai://") + f"/?authKey=benchmark&qq=1",
+                        polling_scheduler=scheduler)
+            app.receiver("GroupMessage")(bench_polling_receiver)
+            await app.enable_session()
+            app.queue = asyncio.Queue()
+            stub.injected.clear()
+            traffic = sample_group_traffic(count)
+            polling = asyncio.ensure_future(app.message_polling())
+            injecting = asyncio.ensure_future(inject_traffic(stub, traffic, 0))
+            latencies = []
+            while len(latencies) < count:
+                event, _ = await app.queue.get()
+                latencies.append(time.monotonic() - stub.injected[event.body.messageChain.getSource().id])
+            polling.cancel()
+            await injecting
+            await app.release()
+            print(f"polling {name}: p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms, {scheduler.stats()}")
+    finally:
+        await runner.cleanup()
+
+
+async def bench_polling_receiver(message: GroupMessage):
+    pass
+
+
+def bench_polling(count: int = 600):
+    asyncio.run(bench_polling_async(count))
+
+
+def legacy_dispatch_lookup(app: Mirai, name: str):
+    """旧版 event_runner 每个事件都要做的查找, 仅用于对比"""
+    if name in app.registeredEventNames:
+        return list(app.event.values())[app.registeredEventNames.index(name)]
+
+
+def bench_dispatch(events: int = 20000):
+    from mirai.event.external.enums import ExternalEvents
+    app = Mirai("mirai://127.0.0.1:8080/?authKey=benchmark&qq=1")
+    for event_name in list(ExternalEvents.__members__)[:20] + ["GroupMessage", "FriendMessage", "TempMessage"]:
+        app.receiver(event_name)(bench_polling_receiver)
+    names = [random.Random(i).choice(["GroupMessage", "GroupMessage", "FriendMessage", "BotOnlineEvent"])
+             for i in range(0, events)]
+    table = app.build_dispatch_table()
+    for name in set(names):
+        assert tuple(legacy_dispatch_lookup(app, name)) == table[name]
+    start = time.time()
+    for name in names:
+        legacy_dispatch_lookup(app, name)
+    legacy = time.time() - start
+    start = time.time()
+    for name in names:
+        app.dispatch_table.get(name)
+    precompiled = time.time() - start
+    print(f"dispatch lookup with {len(table)} event types x{events}: "
+          f"legacy {events / legacy:.0f} events/s, table {events / precompiled:.0f} events/s")
+
+
+async def bench_handler(app: Mirai, group: Group, member: Member, message: GroupMessage):
+    pass
+
+
+def legacy_call_params(app: Mirai, callable_target, event_context) -> dict:
+    """旧版 executor 每次调用处理函数时的参数解析, 仅用于对比"""
+    place_annotation = app.get_annotations_mapping()
+    return {
+        name: place_annotation[annotation](event_context)
+        for name, annotation, default in argument_signature(callable_target)
+    }
+
+
+def planned_call_params(app: Mirai, callable_target, event_context) -> dict:
+    return {
+        name: getter(event_context)
+        for name, annotation, getter, depend in app.signature_plan(callable_target)
+    }
+
+
+async def bench_executor_async(calls: int):
+    app = Mirai("mirai://127.0.0.1:8080/?authKey=benchmark&qq=1")
+    data = sample_group_traffic(1)[0]
+    data["messageChain"] = MessageChain.lazy(data["messageChain"])
+    event_context = InternalEvent(name="GroupMessage", body=GroupMessage.parse_obj(data))
+    assert legacy_call_params(app, bench_handler, event_context) == planned_call_params(app, bench_handler, event_context)
+    for name, build in (("legacy", legacy_call_params), ("planned", planned_call_params)):
+        start = time.perf_counter()
+        for i in range(0, calls):
+            await bench_handler(**build(app, bench_handler, event_context))
+        spend = time.perf_counter() - start
+        print(f"handler call with {name} parameters: {spend / calls * 1e6:.1f}us/call")
+    executor_protocol = ExecutorProtocol(callable=bench_handler, dependencies=[], middlewares=[])
+    start = time.perf_counter()
+    for i in range(0, calls):
+        await app.executor(executor_protocol, event_context)
+    spend = time.perf_counter() - start
+    print(f"Mirai.executor: {spend / calls * 1e6:.1f}us/call")
+
+
+def bench_executor(calls: int = 5000):
+    asyncio.run(bench_executor_async(calls))
+
+
+COMMAND_TEXTS = ("m d AB CD", "m t EF", "m show", "m 开始", "m 自定义 10 10 10", "扫雷", "哈哈哈", "今天吃什么", "m")
+
+
+def legacy_command_chain(text: str, in_game: bool = True):
+    """旧版 msg_handel 对每条消息依次检查的条件, 只记录匹配的命令, 仅用于对比"""
+    matched = None
+    if text == "扫雷":
+        matched = "help"
+    if len(text) > 2 and text[:1] == "m":
+        commands = text.split(" ")
+        for name in ("开始", "中级", "高级"):
+            if commands[1] == name:
+                matched = name
+        if commands[1] == "自定义" and len(commands) == 5:
+            matched = "自定义"
+        if commands[1] == "help":
+            matched = "help"
+        if not in_game:
+            return matched
+        for name in ("show", "exit"):
+            if commands[1] == name:
+                matched = name
+        if len(commands) < 3:
+            return matched
+        for name in ("d", "t"):
+            if commands[1] == name:
+                matched = name
+    return matched
+
+
+async def bench_command_body(ctx, *args):
+    pass
+
+
+def bench_command(messages: int = 100000):
+    router = CommandRouter()
+    router.register("扫雷")(bench_command_body)
+    for name in ("开始", "中级", "高级", "help", "show", "exit", "d", "t"):
+        router.register(name, prefix="m")(bench_command_body)
+
+    async def custom(ctx, row: int, column: int, mines: int):
+        pass
+    router.register("自定义", prefix="m")(custom)
+    texts = [random.Random(i).choice(COMMAND_TEXTS) for i in range(0, messages)]
+    start = time.time()
+    for text in texts:
+        legacy_command_chain(text)
+    legacy = time.time() - start
+    start = time.time()
+    for text in texts:
+        matched = router.match(text)
+        if matched is not None:
+            matched[0].convert(matched[1])
+    routed = time.time() - start
+    print(f"command lookup x{messages}: if chain {legacy / messages * 1e6:.2f}us/msg, "
+          f"router {routed / messages * 1e6:.2f}us/msg")
+
+
+BENCHMARKS = {
+    "mine": bench_mine,
+    "gen_mine": bench_gen_mine,
+    "count_around": bench_count_around,
+    "render": bench_render,
+    "memory": bench_memory,
+    "http": bench_http,
+    "upload_memory": bench_upload_memory,
+    "encode_chain": bench_encode_chain,
+    "parse_chain": bench_parse_chain,
+    "json": bench_json,
+    "polling": bench_polling,
+    "dispatch": bench_dispatch,
+    "executor": bench_executor,
+    "command": bench_command
+}
+
+
+if __name__ == '__main__':
+    # python benchmarker.py [名字 ...], 不指定时运行全部
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,16 +1,21 @@
 from mirai import Mirai, Plain, At, Group, Member, Image, Friend, FriendMessage, GroupMessage, TempMessage
 from mirai.event.message.models import MessageItemType
+from mirai.command import CommandError
+from mirai.ratelimit import SendQueue
 from config import mirai_api_http_locate, authKey, qq
-from minesweeper import MineSweeper, GameState
-from typing import Dict
-from io import BytesIO
+from minesweeper import MineSweeper, GameState, tile_atlas
+from renderer import RenderPool
+from typing import Dict, NamedTuple, Union
 from time import time, sleep
 from threading import Thread
 import signal
 
-app = Mirai(f"mirai://{mirai_api_http_locate}?authKey={authKey}&qq={qq}", websocket=True)
+# 发送消息经过限速队列, 避免短时间内大量发送导致机器人被风控
+app = Mirai(f"mirai://{mirai_api_http_locate}?authKey={authKey}&qq={qq}", websocket=True, send_queue=SendQueue())
 running = True
 in_gaming_list: Dict[int, MineSweeper] = {}
+# 绘制游戏盘放到线程池中执行, 传入 use_process=True 可改用进程池
+render_pool = RenderPool()
 
 HELP = """
 欢迎游玩扫雷小游戏
@@ -34,24 +39,22 @@ def clean_thread():
         sleep(2)
 
 
-async def send_msg(target, msg: list, user, msg_type):
+async def send_msg(target, msg: list, user, msg_type, coalesce_key=None):
     if msg_type is MessageItemType.GroupMessage:
         msg.insert(0, At(user.id))
-        await app.sendGroupMessage(target, msg)
+        await app.sendGroupMessage(target, msg, coalesceKey=coalesce_key)
         return
     if msg_type is MessageItemType.FriendMessage:
-        await app.sendFriendMessage(target, msg)
+        await app.sendFriendMessage(target, msg, coalesceKey=coalesce_key)
         return
     if msg_type is MessageItemType.TempMessage:
-        await app.sendTempMessage(target, user, msg)
+        await app.sendTempMessage(target, user, msg, coalesceKey=coalesce_key)
 
 
 async def send_panel(app: Mirai, group: Group, member: Member, msg_type):
-    byte_io = BytesIO()
-    in_gaming_list[member.id].draw_panel().save(byte_io, format="jpeg")
-    byte_io.flush()
-    await send_msg(group, [Image.fromIO(byte_io)], member, msg_type)
-    byte_io.close()
+    data = await render_pool.render(in_gaming_list[member.id])
+    # 同一个玩家还在排队的旧游戏盘会被新的替换掉
+    await send_msg(group, [Image.fromBytes(data)], member, msg_type, coalesce_key=("panel", member.id))
 
 
 async def send_game_over(app: Mirai, group: Group, member: Member, msg_type):
@@ -65,90 +68,117 @@ async def send_game_over(app: Mirai, group: Group, member: Member, msg_type):
     del in_gaming_list[member.id]
 
 
-@app.receiver("FriendMessage")
+class CommandContext(NamedTuple):
+    source: Union[Group, Friend]
+    user: Union[Member, Friend]
+    msg_type: MessageItemType
+
+
+# 第一个词不是任何命令开头的消息不会被解析和处理
+@app.receiver("FriendMessage", pre_filter=app.commands.pre_filter)
 async def friend_handel(app: Mirai, friend: Friend, message: FriendMessage):
     plain: Plain = message.messageChain.getFirstComponent(Plain)
     await msg_handel(friend, plain, friend, MessageItemType.FriendMessage)
 
 
-@app.receiver("TempMessage")
+@app.receiver("TempMessage", pre_filter=app.commands.pre_filter)
 async def tm_handel(app: Mirai, group: Group, member: Member, message: TempMessage):
     plain: Plain = message.messageChain.getFirstComponent(Plain)
     await msg_handel(group, plain, member, MessageItemType.TempMessage)
 
 
-@app.receiver("GroupMessage")
+@app.receiver("GroupMessage", pre_filter=app.commands.pre_filter)
 async def gm_handel(app: Mirai, group: Group, member: Member, message: GroupMessage):
     plain: Plain = message.messageChain.getFirstComponent(Plain)
     await msg_handel(group, plain, member, MessageItemType.GroupMessage)
 
 
-async def new_game(source, user, msg_type, row: int, column: int, mines: int):
-    if user.id in in_gaming_list:
-        await send_msg(source, [Plain("你已经在游戏中了")], user, msg_type)
+async def msg_handel(source, plain, user, msg_type):
+    if plain is None:
         return
-    in_gaming_list[user.id] = MineSweeper(row, column, mines)
-    await send_panel(app, source, user, msg_type)
+    try:
+        await app.commands.dispatch(plain.text, CommandContext(source, user, msg_type))
+    except CommandError as e:
+        await send_msg(source, [Plain(f"错误: {e}")], user, msg_type)
 
 
-async def msg_handel(source, plain, user, msg_type):
-    if plain is None:
+async def new_game(ctx: CommandContext, row: int, column: int, mines: int):
+    if ctx.user.id in in_gaming_list:
+        await send_msg(ctx.source, [Plain("你已经在游戏中了")], ctx.user, ctx.msg_type)
         return
-    if plain.text == "扫雷":
-        await send_msg(source, [Plain(HELP)], user, msg_type)
-    if len(plain.text) > 2 and plain.text[:1] == "m":
-        commands = plain.text.split(" ")
-        if commands[1] == "开始":
-            await new_game(source, user, msg_type, 10, 10, 10)
-        if commands[1] == "中级":
-            await new_game(source, user, msg_type, 16, 16, 40)
-        if commands[1] == "高级":
-            await new_game(source, user, msg_type, 20, 20, 90)
-
-        if commands[1] == "自定义" and len(commands) == 5:
-            try:
-                await new_game(source, user, msg_type, int(commands[2]), int(commands[3]), int(commands[4]))
-            except ValueError as e:
-                await send_msg(source, [Plain(f"错误 {e}")], user, msg_type)
-        if commands[1] == "help":
-            await send_msg(source, [Plain(HELP)], user, msg_type)
-
-        # 以下命令只有在游戏中才可以使用
-        if user.id not in in_gaming_list:
-            return
-        if commands[1] == "show":
-            await send_panel(app, source, user, msg_type)
-
-        if commands[1] == "exit":
-            if user.id in in_gaming_list:
-                await send_msg(source, [Plain("退出成功")], user, msg_type)
-                del in_gaming_list[user.id]
-            else:
-                await send_msg(source, [Plain("请输入 m 开始 开始游戏")], user, msg_type)
-        # 命令长度大于3才可以使用
-        if len(commands) < 3:
-            return
-        if commands[1] == "d":
-            try:
-                for i in range(2, len(commands)):
-                    location = MineSweeper.parse_input(commands[i])
-                    in_gaming_list[user.id].mine(location[0], location[1])
-                    if in_gaming_list[user.id].state != GameState.GAMING:
-                        break
-            except ValueError as e:
-                await send_msg(source, [Plain(f"错误: {e}")], user, msg_type)
-            await send_panel(app, source, user, msg_type)
-            if in_gaming_list[user.id].state != GameState.GAMING:
-                await send_game_over(app, source, user, msg_type)
-
-        if commands[1] == "t":
-            try:
-                for i in range(2, len(commands)):
-                    location = MineSweeper.parse_input(commands[i])
-                    in_gaming_list[user.id].tag(location[0], location[1])
-                await send_panel(app, source, user, msg_type)
-            except ValueError as e:
-                await send_msg(source, [Plain(f"错误: {e}")], user, msg_type)
+    in_gaming_list[ctx.user.id] = MineSweeper(row, column, mines, compact=True)
+    await send_panel(app, ctx.source, ctx.user, ctx.msg_type)
+
+
+def in_game(ctx: CommandContext) -> bool:
+    """show, exit, d, t 只有在游戏中才可以使用, 在转换参数之前检查, 不在游戏中的人发送的这些命令直接忽略"""
+    return ctx.user.id in in_gaming_list
+
+
+@app.command("扫雷")
+@app.command("help", prefix="m", ignore_extra=True)
+async def show_help(ctx: CommandContext):
+    await send_msg(ctx.source, [Plain(HELP)], ctx.user, ctx.msg_type)
+
+
+@app.command("开始", prefix="m", ignore_extra=True)
+async def start_game(ctx: CommandContext):
+    await new_game(ctx, 10, 10, 10)
+
+
+@app.command("中级", prefix="m", ignore_extra=True)
+async def start_medium_game(ctx: CommandContext):
+    await new_game(ctx, 16, 16, 40)
+
+
+@app.command("高级", prefix="m", ignore_extra=True)
+async def start_hard_game(ctx: CommandContext):
+    await new_game(ctx, 20, 20, 90)
+
+
+@app.command("自定义", prefix="m")
+async def start_custom_game(ctx: CommandContext, row: int, column: int, mines: int):
+    try:
+        await new_game(ctx, row, column, mines)
+    except ValueError as e:
+        await send_msg(ctx.source, [Plain(f"错误 {e}")], ctx.user, ctx.msg_type)
+
+
+@app.command("show", prefix="m", guard=in_game, ignore_extra=True)
+async def show_panel(ctx: CommandContext):
+    await send_panel(app, ctx.source, ctx.user, ctx.msg_type)
+
+
+@app.command("exit", prefix="m", guard=in_game, ignore_extra=True)
+async def exit_game(ctx: CommandContext):
+    await send_msg(ctx.source, [Plain("退出成功")], ctx.user, ctx.msg_type)
+    del in_gaming_list[ctx.user.id]
+
+
+# 位置参数在执行命令前就转换为 (行, 列), 格式错误时不会操作游戏盘
+@app.command("d", prefix="m", guard=in_game)
+async def dig(ctx: CommandContext, location: MineSweeper.parse_input, *locations: MineSweeper.parse_input):
+    minesweeper = in_gaming_list[ctx.user.id]
+    try:
+        for row, column in (location,) + locations:
+            minesweeper.mine(row, column)
+            if minesweeper.state != GameState.GAMING:
+                break
+    except ValueError as e:
+        await send_msg(ctx.source, [Plain(f"错误: {e}")], ctx.user, ctx.msg_type)
+    await send_panel(app, ctx.source, ctx.user, ctx.msg_type)
+    if minesweeper.state != GameState.GAMING:
+        await send_game_over(app, ctx.source, ctx.user, ctx.msg_type)
+
+
+@app.command("t", prefix="m", guard=in_game)
+async def tag(ctx: CommandContext, location: MineSweeper.parse_input, *locations: MineSweeper.parse_input):
+    try:
+        for row, column in (location,) + locations:
+            in_gaming_list[ctx.user.id].tag(row, column)
+        await send_panel(app, ctx.source, ctx.user, ctx.msg_type)
+    except ValueError as e:
+        await send_msg(ctx.source, [Plain(f"错误: {e}")], ctx.user, ctx.msg_type)
 
 
 def my_exit():
@@ -158,6 +188,7 @@ def my_exit():
 
 
 if __name__ == "__main__":
+    tile_atlas().warm_up()
     Thread(target=clean_thread).start()
     signal.signal(signal.SIGINT, my_exit)
     signal.signal(signal.SIGTERM, my_exit)
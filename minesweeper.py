@@ -1,10 +1,23 @@
 from PIL import Image, ImageDraw, ImageColor, ImageFont
 from enum import Enum
+from array import array
+from collections import deque
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
 import random
-from typing import Tuple
+from typing import List, Optional, Tuple
 from time import time
 
 COLUMN_NAME = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# 每个格子 80 像素, 去掉 1 像素的分割线后可以贴图的部分是 79 像素
+CELL_SIZE = 80
+TILE_SIZE = CELL_SIZE - 1
+COUNT_TEXT_COLOR = {1: "green", 2: "orange", 3: "red", 4: "darkred"}
+# 相对路径的字体都从本文件所在的目录查找, 不依赖启动时的工作目录
+FONT_DIR = Path(__file__).resolve().parent
+FONT_PATH = FONT_DIR / "00TT.TTF"
+FONT_SIZE = 40
 
 
 class GameState(Enum):
@@ -21,14 +34,227 @@ class Cell:
         self.is_marked = is_marked
         self.row = row
         self.column = column
-        self.is_checked = False
+        self.checked = 0
+        self.count = 0
 
     def __str__(self):
         return f"[Cell] is_mine:{self.is_mine} is_marked:{self.is_marked} is_mined:{self.is_mined}"
 
 
+# CompactPanel 中每个格子的状态位
+FLAG_MINE = 1
+FLAG_MINED = 2
+FLAG_MARKED = 4
+
+
+class CellView:
+    """CompactPanel 中某个格子的轻量视图, 只在访问时创建, 读写都直接落到底层的 bytearray 上"""
+    __slots__ = ("_flags", "_counts", "_stamps", "_index", "row", "column")
+
+    def __init__(self, flags: bytearray, counts: bytearray, stamps: array, index: int, row: int, column: int):
+        self._flags = flags
+        self._counts = counts
+        self._stamps = stamps
+        self._index = index
+        self.row = row
+        self.column = column
+
+    def __get_flag(self, flag: int) -> bool:
+        return bool(self._flags[self._index] & flag)
+
+    def __set_flag(self, flag: int, value: bool):
+        if value:
+            self._flags[self._index] |= flag
+        else:
+            self._flags[self._index] &= ~flag
+
+    @property
+    def is_mine(self) -> bool:
+        return self.__get_flag(FLAG_MINE)
+
+    @is_mine.setter
+    def is_mine(self, value: bool):
+        self.__set_flag(FLAG_MINE, value)
+
+    @property
+    def is_mined(self) -> bool:
+        return self.__get_flag(FLAG_MINED)
+
+    @is_mined.setter
+    def is_mined(self, value: bool):
+        self.__set_flag(FLAG_MINED, value)
+
+    @property
+    def is_marked(self) -> bool:
+        return self.__get_flag(FLAG_MARKED)
+
+    @is_marked.setter
+    def is_marked(self, value: bool):
+        self.__set_flag(FLAG_MARKED, value)
+
+    @property
+    def checked(self) -> int:
+        return self._stamps[self._index]
+
+    @checked.setter
+    def checked(self, value: int):
+        self._stamps[self._index] = value
+
+    @property
+    def count(self) -> int:
+        return self._counts[self._index]
+
+    @count.setter
+    def count(self, value: int):
+        self._counts[self._index] = value
+
+    def __str__(self):
+        return f"[Cell] is_mine:{self.is_mine} is_marked:{self.is_marked} is_mined:{self.is_mined}"
+
+
+class CompactRow:
+    __slots__ = ("_flags", "_counts", "_stamps", "_row", "_column")
+
+    def __init__(self, flags: bytearray, counts: bytearray, stamps: array, row: int, column: int):
+        self._flags = flags
+        self._counts = counts
+        self._stamps = stamps
+        self._row = row
+        self._column = column
+
+    def __getitem__(self, column: int) -> CellView:
+        if column < 0 or column >= self._column:
+            raise IndexError("column out of range")
+        return CellView(self._flags, self._counts, self._stamps, self._row * self._column + column, self._row, column)
+
+    def __len__(self):
+        return self._column
+
+
+class CompactPanel:
+    """紧凑的游戏盘, 所有格子的状态以位标记的形式存放在一个 bytearray 里, 周围雷数存放在另一个 bytearray 里,
+    翻开时使用的访问标记存放在一个 array 里
+
+    可以像 list[list[Cell]] 一样通过 panel[row][column] 访问, 返回的是 CellView
+    """
+    __slots__ = ("row", "column", "flags", "counts", "stamps")
+
+    def __init__(self, row: int, column: int):
+        self.row = row
+        self.column = column
+        self.flags = bytearray(row * column)
+        self.counts = bytearray(row * column)
+        self.stamps = array("H", bytes(2 * row * column))
+
+    def __getitem__(self, row: int) -> CompactRow:
+        if row < 0 or row >= self.row:
+            raise IndexError("row out of range")
+        return CompactRow(self.flags, self.counts, self.stamps, row, self.column)
+
+    def __len__(self):
+        return self.row
+
+
+class FontRegistry:
+    """进程内共用的字体缓存, 以 (字体路径, 字号) 为键, 每种字体只在第一次用到时从磁盘加载一次"""
+
+    def __init__(self):
+        self.__fonts = {}
+        self.__stats = {}
+        self.__lock = Lock()
+
+    def get(self, path=FONT_PATH, size: int = FONT_SIZE) -> ImageFont.FreeTypeFont:
+        path = Path(path)
+        if not path.is_absolute():
+            path = FONT_DIR / path
+        key = (str(path), size)
+        font = self.__fonts.get(key)
+        if font is None:
+            with self.__lock:
+                font = self.__fonts.get(key)
+                if font is None:
+                    start = time()
+                    font = ImageFont.truetype(str(path), size)
+                    self.__stats[key] = {"load_time": time() - start, "hits": 0}
+                    self.__fonts[key] = font
+                    return font
+        self.__stats[key]["hits"] += 1
+        return font
+
+    def stats(self) -> dict:
+        """每种字体的加载耗时 (秒) 和缓存命中次数"""
+        return {key: dict(value) for key, value in self.__stats.items()}
+
+
+fonts = FontRegistry()
+
+
+class TileAtlas:
+    """所有游戏共用的格子贴图
+
+    每种 (底色, 文字) 组合只在第一次用到时渲染一次, 之后绘制游戏盘只需要贴图, 不再逐帧渲染文字
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        # 坐标标签统一按 "AA" 的大小居中
+        self.__label_size = font.getsize("AA")
+        self.__tiles = {}
+
+    def label_tile(self, background: str, row: int, column: int) -> Image.Image:
+        """还没有挖开的格子, 显示它的坐标"""
+        text = f"{COLUMN_NAME[row]}{COLUMN_NAME[column]}"
+        key = (background, text)
+        tile = self.__tiles.get(key)
+        if tile is None:
+            tile = self.__render(background, text, "black", self.__label_size)
+            self.__tiles[key] = tile
+        return tile
+
+    def number_tile(self, background: str, count: int) -> Image.Image:
+        """已经挖开的格子, 显示周围的雷数, 为 0 时是空白的"""
+        key = (background, count)
+        tile = self.__tiles.get(key)
+        if tile is None:
+            if count == 0:
+                tile = Image.new("RGB", (TILE_SIZE, TILE_SIZE), ImageColor.getrgb(background))
+            else:
+                text = str(count)
+                tile = self.__render(background, text, COUNT_TEXT_COLOR.get(count, "black"), self.font.getsize(text))
+            self.__tiles[key] = tile
+        return tile
+
+    def warm_up(self):
+        """预先渲染游戏中最常用的贴图: 未挖开的格子, 标记的格子和数字"""
+        for row in range(0, len(COLUMN_NAME)):
+            for column in range(0, len(COLUMN_NAME)):
+                self.label_tile("gray", row, column)
+                self.label_tile("blue", row, column)
+        for count in range(0, 9):
+            self.number_tile("white", count)
+            self.number_tile("blue", count)
+
+    def __render(self, background: str, text: str, color: str, size: Tuple[int, int]) -> Image.Image:
+        tile = Image.new("RGB", (TILE_SIZE, TILE_SIZE), ImageColor.getrgb(background))
+        # 与直接在整张图上居中绘制时的位置一致, 贴图的原点是格子左上角向内 1 像素
+        center = (CELL_SIZE / 2 - 1 - size[0] / 2, CELL_SIZE / 2 - 1 - size[1] / 2)
+        ImageDraw.Draw(tile).text(center, text, fill=ImageColor.getrgb(color), font=self.font)
+        return tile
+
+
+_tile_atlas: Optional[TileAtlas] = None
+
+
+def tile_atlas() -> TileAtlas:
+    global _tile_atlas
+    if _tile_atlas is None:
+        _tile_atlas = TileAtlas(fonts.get(FONT_PATH, FONT_SIZE))
+    return _tile_atlas
+
+
 class MineSweeper:
-    def __init__(self, row: int, column: int, mines: int):
+    def __init__(self, row: int, column: int, mines: int, compact: bool = False, safe_zone: bool = False,
+                 rand: Optional[random.Random] = None, incremental_render: bool = False):
         if row > 26 or column > 26:
             raise ValueError("暂不支持这么大的游戏盘")
         if mines >= row * column or mines == 0:
@@ -38,25 +264,102 @@ class MineSweeper:
         self.row = row
         self.column = column
         self.mines = mines
+        # safe_zone 为 True 时第一次挖开的格子周围 3x3 内不会有雷
+        self.safe_zone = safe_zone
+        # 可以传入固定种子的 random.Random 来复现同一个游戏盘, 不传时使用 random 模块的全局实例
+        self.random = rand
         self.start_time = time()
         self.actions = 0
-        self.font = ImageFont.truetype("00TT.TTF", 40)
-        self.panel = [[Cell(False, row=r, column=c) for c in range(column)] for r in range(row)]
+        self.font = fonts.get(FONT_PATH, FONT_SIZE)
+        if compact:
+            self.panel = CompactPanel(row, column)
+        else:
+            self.panel = [[Cell(False, row=r, column=c) for c in range(column)] for r in range(row)]
         self.state = GameState.PREPARE
+        self.__dig_stamp = 0
+        self.__opened = 0
+        self.__marked = 0
+        # incremental_render 为 True 时保留上一帧, 之后只重绘状态变化过的格子
+        # 一帧图片在 26x26 时约 13MB, 所以默认关闭; 经过 RenderPool 绘制时不支持, 见 RenderPool
+        self.incremental_render = incremental_render
+        self.__frame: Optional[Image.Image] = None
+        self.__dirty = set()
 
     def __str__(self):
         return f"[MineSweeper] {self.mines} in {self.row}*{self.column}"
 
+    def snapshot(self) -> tuple:
+        """可以被 pickle 的游戏盘快照, 用于在其它线程或进程中绘制
+
+        格式为 (row, column, mines, state, flags, counts), flags 与 CompactPanel 的位标记相同
+        """
+        if isinstance(self.panel, CompactPanel):
+            flags = bytes(self.panel.flags)
+            counts = bytes(self.panel.counts)
+        else:
+            flags = bytearray(self.row * self.column)
+            counts = bytearray(self.row * self.column)
+            for i in range(0, self.row):
+                for j in range(0, self.column):
+                    cell = self.panel[i][j]
+                    flags[i * self.column + j] = (FLAG_MINE if cell.is_mine else 0) | \
+                                                 (FLAG_MINED if cell.is_mined else 0) | \
+                                                 (FLAG_MARKED if cell.is_marked else 0)
+                    counts[i * self.column + j] = cell.count
+            flags = bytes(flags)
+            counts = bytes(counts)
+        return self.row, self.column, self.mines, self.state.value, flags, counts
+
+    @classmethod
+    def from_snapshot(cls, snapshot: tuple) -> "MineSweeper":
+        """从 snapshot() 的结果还原一个只用于绘制的游戏"""
+        row, column, mines, state, flags, counts = snapshot
+        game = cls(row, column, mines, compact=True)
+        game.panel.flags[:] = flags
+        game.panel.counts[:] = counts
+        game.state = GameState(state)
+        return game
+
+    @property
+    def opened_count(self) -> int:
+        """已经挖开的安全格子数"""
+        return self.__opened
+
+    @property
+    def marked_count(self) -> int:
+        """当前被标记的格子数"""
+        return self.__marked
+
+    @property
+    def remaining_safe(self) -> int:
+        """还没有挖开的安全格子数"""
+        return self.row * self.column - self.mines - self.__opened
 
     def draw_panel(self) -> Image.Image:
         start = time()
-        img = Image.new("RGB", (80 * self.column, 80 * self.row), (255, 255, 255))
-        self.__draw_split_line(img)
-        self.__draw_cell_cover(img)
-        self.__draw_cell(img)
+        if self.__frame is not None:
+            img = self.__frame
+            atlas = tile_atlas()
+            for i, j in self.__dirty:
+                self.__draw_one_cell(img, atlas, i, j)
+            self.__dirty.clear()
+        else:
+            img = Image.new("RGB", (80 * self.column, 80 * self.row), (255, 255, 255))
+            self.__draw_split_line(img)
+            self.__draw_cell(img)
+            if self.incremental_render:
+                self.__frame = img
+                self.__dirty.clear()
         print(f"draw spend {time()-start}ms at {str(self)}")
+        if self.incremental_render:
+            # 上一帧要留着做下一次的底图, 不能把它交给调用者修改
+            return img.copy()
         return img
 
+    def __mark_dirty(self, cells):
+        if self.__frame is not None:
+            self.__dirty.update(cells)
+
     def __draw_split_line(self, img: Image.Image):
         draw = ImageDraw.Draw(img)
         for i in range(0, self.row):
@@ -64,54 +367,30 @@ class MineSweeper:
         for i in range(0, self.column):
             draw.line((i * 80, 0, i * 80, img.size[1]), fill=ImageColor.getrgb("black"))
 
-    def __draw_cell_cover(self, img: Image.Image):
-        draw = ImageDraw.Draw(img)
-        for i in range(0, self.row):
-            for j in range(0, self.column):
-                cell = self.panel[i][j]
-                if self.state == GameState.FAIL and cell.is_mine:
-                    draw.rectangle((j * 80 + 1, i * 80 + 1, (j + 1) * 80 - 1, (i + 1) * 80 - 1),
-                                   fill=ImageColor.getrgb("red"))
-                    continue
-                if cell.is_marked:
-                    draw.rectangle((j * 80 + 1, i * 80 + 1, (j + 1) * 80 - 1, (i + 1) * 80 - 1),
-                                   fill=ImageColor.getrgb("blue"))
-                    continue
-                if not cell.is_mined:
-                    draw.rectangle((j * 80 + 1, i * 80 + 1, (j + 1) * 80 - 1, (i + 1) * 80 - 1),
-                                   fill=ImageColor.getrgb("gray"))
-
     def __draw_cell(self, img: Image.Image):
-        draw = ImageDraw.Draw(img)
+        atlas = tile_atlas()
         for i in range(0, self.row):
             for j in range(0, self.column):
-                cell = self.panel[i][j]
-                if not cell.is_mined:
-                    font_size = self.font.getsize("AA")
-                    index = f"{COLUMN_NAME[i]}{COLUMN_NAME[j]}"
-                    center = (80 * (j + 1) - (font_size[0] / 2) - 40, 80 * (i + 1) - 40 - (font_size[1] / 2))
-                    draw.text(center, index, fill=ImageColor.getrgb("black"), font=self.font)
-                else:
-                    count = self.count_around(i, j)
-                    if count == 0:
-                        continue
-                    font_size = self.font.getsize(str(count))
-                    center = (80 * (j + 1) - (font_size[0] / 2) - 40, 80 * (i + 1) - 40 - (font_size[1] / 2))
-                    draw.text(center, str(count), fill=self.__get_count_text_color(count), font=self.font)
+                self.__draw_one_cell(img, atlas, i, j)
 
-    @staticmethod
-    def __get_count_text_color(count):
-        if count == 1:
-            return ImageColor.getrgb("green")
-        if count == 2:
-            return ImageColor.getrgb("orange")
-        if count == 3:
-            return ImageColor.getrgb("red")
-        if count == 4:
-            return ImageColor.getrgb("darkred")
-        return ImageColor.getrgb("black")
-
-    def mine(self, row: int, column: int):
+    def __draw_one_cell(self, img: Image.Image, atlas: TileAtlas, i: int, j: int):
+        cell = self.panel[i][j]
+        if self.state == GameState.FAIL and cell.is_mine:
+            background = "red"
+        elif cell.is_marked:
+            background = "blue"
+        elif not cell.is_mined:
+            background = "gray"
+        else:
+            background = "white"
+        if not cell.is_mined:
+            tile = atlas.label_tile(background, i, j)
+        else:
+            tile = atlas.number_tile(background, self.count_around(i, j))
+        img.paste(tile, (j * 80 + 1, i * 80 + 1))
+
+    def mine(self, row: int, column: int) -> List[Tuple[int, int]]:
+        """挖开一个格子, 返回这一次被翻开的所有格子的位置"""
         if not self.__is_valid_location(row, column):
             raise ValueError("非法操作")
         start = time()
@@ -119,18 +398,23 @@ class MineSweeper:
         if cell.is_mined:
             raise ValueError("你已经挖过这里了")
         cell.is_mined = True
+        self.__mark_dirty(((row, column),))
         if self.state == GameState.PREPARE:
-            self.__gen_mine()
+            self.__gen_mine(row, column)
         if self.state != GameState.GAMING:
             raise ValueError("游戏已结束")
         self.actions += 1
         if cell.is_mine:
             self.state = GameState.FAIL
-            return
-        self.__reset_check()
-        self.__spread_not_mine(row, column)
+            # 失败时所有的雷都要重绘, 直接丢掉上一帧
+            self.__frame = None
+            return [(row, column)]
+        opened = self.__spread_not_mine(row, column)
+        self.__opened += len(opened)
+        self.__mark_dirty(opened)
         self.__win_check()
         print(f"mine spend {time()-start}ms at {str(self)}")
+        return opened
 
     def tag(self, row: int, column: int):
         cell = self.panel[row][column]
@@ -140,71 +424,123 @@ class MineSweeper:
         if self.state != GameState.GAMING and self.state != GameState.PREPARE:
             raise ValueError("游戏已结束")
         self.actions += 1
+        self.__mark_dirty(((row, column),))
         if cell.is_marked:
             cell.is_marked = False
+            self.__marked -= 1
         else:
             cell.is_marked = True
+            self.__marked += 1
         print(f"tag spend {time()-start}ms at {str(self)}")
 
-    def __gen_mine(self):
-        count = 0
-        while count < self.mines:
-            row = random.randint(0, self.row - 1)
-            column = random.randint(0, self.column - 1)
-            if self.panel[row][column].is_mine or self.panel[row][column].is_mined:
-                continue
-            self.panel[row][column].is_mine = True
-            count += 1
+    def __gen_mine(self, row: int, column: int):
+        """在第一次挖开 (row, column) 之后一次性均匀地放置所有的雷"""
+        excluded = {row * self.column + column}
+        if self.safe_zone:
+            zone = {i * self.column + j
+                    for i in range(max(row - 1, 0), min(row + 2, self.row))
+                    for j in range(max(column - 1, 0), min(column + 2, self.column))}
+            # 雷太多时放不下安全区, 退回到只保证第一次挖开的格子安全
+            if self.row * self.column - len(zone) >= self.mines:
+                excluded = zone
+        candidates = [i for i in range(self.row * self.column) if i not in excluded]
+        compact = isinstance(self.panel, CompactPanel)
+        for index in (self.random or random).sample(candidates, self.mines):
+            if compact:
+                self.panel.flags[index] |= FLAG_MINE
+            else:
+                self.panel[index // self.column][index % self.column].is_mine = True
+        if compact:
+            self.__build_compact_counts()
+        else:
+            self.__build_counts()
         self.state = GameState.GAMING
 
-    def __spread_not_mine(self, row: int, column):
-        if not self.__is_valid_location(row, column):
-            return
-        cell = self.panel[row][column]
-        if cell.is_checked:
-            return
-        if cell.is_mine:
-            return
-        cell.is_mined = True
-        cell.is_checked = True
-        count = self.count_around(row, column)
-        if count > 0:
-            return
-        self.__spread_not_mine(row + 1, column)
-        self.__spread_not_mine(row - 1, column)
-        self.__spread_not_mine(row, column + 1)
-        self.__spread_not_mine(row, column - 1)
-        if count == 0:
-            self.__spread_not_mine(row + 1, column + 1)
-            self.__spread_not_mine(row - 1, column - 1)
-            self.__spread_not_mine(row + 1, column - 1)
-            self.__spread_not_mine(row - 1, column + 1)
-
-    def __reset_check(self):
-        for i in range(0, self.row):
-            for j in range(0, self.column):
-                self.panel[i][j].is_checked = False
+    def __build_counts(self):
+        """雷的位置确定后一次性算出每个格子周围的雷数, 之后只需 O(1) 读取"""
+        for r in range(0, self.row):
+            for c in range(0, self.column):
+                if not self.panel[r][c].is_mine:
+                    continue
+                for i in range(max(r - 1, 0), min(r + 2, self.row)):
+                    for j in range(max(c - 1, 0), min(c + 2, self.column)):
+                        if i == r and j == c:
+                            continue
+                        self.panel[i][j].count += 1
+
+    def __build_compact_counts(self):
+        """CompactPanel 版本的 __build_counts, 直接读写底层数组, 不为每个格子创建 CellView"""
+        flags = self.panel.flags
+        counts = self.panel.counts
+        for index in range(0, self.row * self.column):
+            if not flags[index] & FLAG_MINE:
+                continue
+            r, c = divmod(index, self.column)
+            for i in range(max(r - 1, 0), min(r + 2, self.row)):
+                for j in range(max(c - 1, 0), min(c + 2, self.column)):
+                    if i != r or j != c:
+                        counts[i * self.column + j] += 1
+
+    def __spread_not_mine(self, row: int, column: int) -> List[Tuple[int, int]]:
+        """从 (row, column) 开始广度优先地翻开周围的空白区域
+
+        每次挖掘使用一个新的访问标记, 不需要在挖掘前重置整个游戏盘
+        起点在调用前已经被标记为挖开, 返回值中包含起点
+        """
+        self.__dig_stamp += 1
+        stamp = self.__dig_stamp
+        if isinstance(self.panel, CompactPanel):
+            return self.__spread_compact(row, column, stamp)
+        self.panel[row][column].checked = stamp
+        opened = [(row, column)]
+        queue = deque(((row, column),))
+        while queue:
+            r, c = queue.popleft()
+            if self.panel[r][c].count > 0:
+                continue
+            for i in range(max(r - 1, 0), min(r + 2, self.row)):
+                for j in range(max(c - 1, 0), min(c + 2, self.column)):
+                    cell = self.panel[i][j]
+                    if cell.checked == stamp or cell.is_mine:
+                        continue
+                    cell.checked = stamp
+                    if not cell.is_mined:
+                        cell.is_mined = True
+                        opened.append((i, j))
+                    queue.append((i, j))
+        return opened
+
+    def __spread_compact(self, row: int, column: int, stamp: int) -> List[Tuple[int, int]]:
+        """CompactPanel 版本的 __spread_not_mine, 按下标直接访问 flags, counts 和 stamps"""
+        flags = self.panel.flags
+        counts = self.panel.counts
+        stamps = self.panel.stamps
+        width = self.column
+        stamps[row * width + column] = stamp
+        opened = [(row, column)]
+        queue = deque(((row, column),))
+        while queue:
+            r, c = queue.popleft()
+            if counts[r * width + c] > 0:
+                continue
+            for i in range(max(r - 1, 0), min(r + 2, self.row)):
+                for j in range(max(c - 1, 0), min(c + 2, width)):
+                    index = i * width + j
+                    if stamps[index] == stamp or flags[index] & FLAG_MINE:
+                        continue
+                    stamps[index] = stamp
+                    if not flags[index] & FLAG_MINED:
+                        flags[index] |= FLAG_MINED
+                        opened.append((i, j))
+                    queue.append((i, j))
+        return opened
 
     def __win_check(self):
-        mined = 0
-        for i in range(0, self.row):
-            for j in range(0, self.column):
-                if self.panel[i][j].is_mined:
-                    mined += 1
-        if mined == (self.column * self.row) - self.mines:
+        if self.remaining_safe == 0:
             self.state = GameState.WIN
 
     def count_around(self, row: int, column: int) -> int:
-        count = 0
-        for r in range(row - 1, row + 2):
-            for c in range(column - 1, column + 2):
-                if not self.__is_valid_location(r, c):
-                    continue
-                if self.panel[r][c].is_mine:
-                    count += 1
-        if self.panel[row][column].is_mine:
-            count -= 1
-        return count
+        return self.panel[row][column].count
 
     @staticmethod
     def parse_input(input_text: str) -> Tuple[int, int]:
@@ -218,6 +554,16 @@ class MineSweeper:
         return True
 
 
+def render_snapshot(snapshot: tuple, format: str = "jpeg") -> bytes:
+    """绘制 MineSweeper.snapshot() 得到的快照并编码为图片, 可以直接交给线程池或进程池执行
+
+    每次都完整绘制, 不使用 incremental_render
+    """
+    byte_io = BytesIO()
+    MineSweeper.from_snapshot(snapshot).draw_panel().save(byte_io, format=format)
+    return byte_io.getvalue()
+
+
 if __name__ == '__main__':
     mine = MineSweeper(25, 25, 25)
     mine.draw_panel().show()
@@ -2,8 +2,7 @@ import asyncio
 import copy
 import inspect
 import traceback
-from functools import partial, lru_cache
-from async_lru import alru_cache
+from functools import partial
 from typing import (
     Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Union)
 from urllib import parse
@@ -13,7 +12,7 @@ import pydantic
 import aiohttp
 import sys
 
-from mirai.depend import Depend
+from mirai.depend import Depend, DependencyCache
 from mirai.entities.friend import Friend
 from mirai.entities.group import Group, Member
 from mirai.event import ExternalEvent, ExternalEventTypes, InternalEvent
@@ -28,10 +27,15 @@ from mirai.logger import (
   Network as NetworkLogger
 )
 from mirai.misc import argument_signature, raiser, TRACEBACKED, printer
-from mirai.network import fetch
+from mirai.network import fetch, PooledFetch
+from mirai.codec import json_codec
+from mirai.polling import PollingScheduler
+from mirai.dispatcher import EventDispatcher
+from mirai.command import CommandRouter
+from mirai.image import ImageUploadCache
+from mirai.ratelimit import SendQueue
 from mirai.protocol import MiraiProtocol
 from mirai.entities.builtins import ExecutorProtocol
-from functools import lru_cache
 from mirai import exceptions
 
 class Mirai(MiraiProtocol):
@@ -50,6 +54,8 @@ class Mirai(MiraiProtocol):
   extensite_config: Dict
   global_dependencies: List[Depend]
   global_middlewares: List
+  # 事件名 -> 处理函数, 由 build_dispatch_table 从 event 生成, 为 None 时需要重新生成
+  dispatch_table: Optional[Dict[str, tuple]] = None
 
   def __init__(self,
     url: Optional[str] = None,
@@ -62,12 +68,52 @@ class Mirai(MiraiProtocol):
     websocket: bool = False,
     extensite_config: dict = None,
     global_dependencies: List[Depend] = None,
-    global_middlewares: List = None
+    global_middlewares: List = None,
+
+    http_pool_limit: int = 100,
+    http_keepalive_timeout: float = 15,
+    http_timeout: Optional[float] = 60,
+
+    image_cache_size: int = 256,
+    image_cache_ttl: Optional[float] = 3600,
+
+    send_queue: Optional[SendQueue] = None,
+
+    json_backend: Optional[str] = None,
+
+    polling_scheduler: Optional[PollingScheduler] = None,
+
+    event_dispatcher: Optional[EventDispatcher] = None
   ):
     self.extensite_config = extensite_config or {}
+    self.http_pool = PooledFetch(
+      limit=http_pool_limit,
+      keepalive_timeout=http_keepalive_timeout,
+      timeout=http_timeout
+    )
+    # 相同内容的图片只上传一次, image_cache_size 为 0 时关闭
+    self.image_cache = ImageUploadCache(image_cache_size, image_cache_ttl) \
+      if image_cache_size else None
+    # 传入 SendQueue 时所有消息发送都要经过它限速
+    self.send_queue = send_queue
+    # orjson, ujson 或 json, 不指定时使用已安装的最快的一个
+    if json_backend:
+      json_codec.use(json_backend)
+    # HTTP 轮询模式下根据积压情况调整拉取间隔和数量
+    self.polling_scheduler = polling_scheduler or PollingScheduler()
+    # 事件由固定数量的 worker 执行, 同一个发送者的事件按顺序执行
+    self.event_dispatcher = event_dispatcher or EventDispatcher()
     self.global_dependencies = global_dependencies or []
     self.global_middlewares = global_middlewares or []
     self.useWebsocket = websocket
+    # 收到的原始事件经过 prefilter 后被放行和丢弃的数量, 以及放行的事件中被跳过的处理函数数
+    self.prefilter_stats = {"passed": 0, "dropped": 0, "skipped": 0}
+    # 处理函数 -> signature_plan 编译出的参数注入方式
+    self.signature_plans: Dict[Callable, tuple] = {}
+    # 依赖缓存在所有事件中的命中和未命中次数
+    self.dependency_stats = {"hits": 0, "misses": 0}
+    # 通过 command 注册的文本命令
+    self.commands = CommandRouter()
 
     if url:
       urlinfo = parse.urlparse(url)
@@ -103,6 +149,7 @@ class Mirai(MiraiProtocol):
         raise ValueError("invaild arguments")
 
   async def enable_session(self):
+    await self.http_pool.open()
     auth_response = await self.auth()
     if all([
       "code" in auth_response and auth_response['code'] == 0,
@@ -126,8 +173,12 @@ class Mirai(MiraiProtocol):
   def receiver(self,
       event_name,
       dependencies: List[Depend] = None,
-      use_middlewares: List[Callable] = None
+      use_middlewares: List[Callable] = None,
+      pre_filter: Optional[Callable[[dict], bool]] = None
     ):
+    """pre_filter 接收 mirai-api-http 推送的原始 dict, 在解析之前调用.
+    某类事件的所有 receiver 都声明了 pre_filter 且都返回 False 时, 这个事件不会被解析和放入队列.
+    """
     event_name = self.getEventCurrentName(event_name)
     def receiver_warpper(func: Callable):
       if not inspect.iscoroutinefunction(func):
@@ -137,37 +188,105 @@ class Mirai(MiraiProtocol):
       self.event[event_name].append(ExecutorProtocol(
         callable=func,
         dependencies=(dependencies or []) + self.global_dependencies,
-        middlewares=(use_middlewares or []) + self.global_middlewares
+        middlewares=(use_middlewares or []) + self.global_middlewares,
+        pre_filter=pre_filter
       ))
+      self.dispatch_table = None
       return func
     return receiver_warpper
 
-  async def message_polling(self, count=10):
-    while True:
-      await asyncio.sleep(0.5)
+  def command(self,
+    name: str,
+    *aliases: str,
+    prefix: Optional[str] = None,
+    guard: Optional[Callable[[Any], bool]] = None,
+    ignore_extra: bool = False
+  ):
+    """注册文本命令, 处理函数的第一个参数为 self.commands.dispatch 传入的 context, 其余参数按注解从命令文本中转换.
+
+    @app.command("d", prefix="m") 匹配 "m d A1 B2", prefix 为 None 时 name 本身就是整条命令.
+    guard(context) 返回 False 时命令被忽略, 在转换参数之前调用; ignore_extra 为 True 时忽略多出的参数.
+    """
+    return self.commands.register(name, *aliases, prefix=prefix, guard=guard, ignore_extra=ignore_extra)
+
+  def prefilter(self, received_data: dict) -> tuple:
+    """返回放行了收到的原始事件的处理函数, 为空时事件不需要解析, 没有 receiver 的事件类型总是被丢弃.
+    事件只会交给这里返回的处理函数, pre_filter 返回 False 的处理函数不会被调用.
+    """
+    if self.dispatch_table is None:
+      self.build_dispatch_table()
+    event_bodys = self.dispatch_table.get(received_data.get('type'), ())
+    passed = tuple(
+      executor_protocol for executor_protocol in event_bodys
+      if self.run_pre_filter(executor_protocol, received_data)
+    )
+    if passed:
+      self.prefilter_stats["passed"] += 1
+      self.prefilter_stats["skipped"] += len(event_bodys) - len(passed)
+    else:
+      self.prefilter_stats["dropped"] += 1
+    return passed
+
+  @staticmethod
+  def run_pre_filter(executor_protocol: ExecutorProtocol, received_data: dict) -> bool:
+    if executor_protocol.pre_filter is None:
+      return True
+    try:
+      return bool(executor_protocol.pre_filter(received_data))
+    except Exception:
+      EventLogger.error(f"pre_filter of {received_data.get('type')} threw a exception, the event has been passed.")
+      traceback.print_exc()
+      return True
+
+  async def queue_event(self, event_context: InternalEvent, event_bodys: Optional[tuple] = None):
+    "event_bodys 为 prefilter 放行的处理函数, 为 None 时交给这个事件的所有处理函数."
+    await self.queue.put((event_context, event_bodys))
+
+  async def message_polling(self, max_batches: int = 100):
+    """拉取和解析分开在两个协程中进行, 解析消息时不会推迟下一次拉取.
+    等待解析的批次最多 max_batches 个, 满了之后拉取会等待解析跟上; 解析的协程意外退出时会被重新启动.
+    """
+    batches = asyncio.Queue(max_batches)
+    dispatcher = None
+    try:
+      while True:
+        if dispatcher is None or dispatcher.done():
+          if dispatcher is not None and not dispatcher.cancelled() and dispatcher.exception():
+            EventLogger.error("message dispatcher exited unexpectedly, restarting it.")
+          dispatcher = asyncio.ensure_future(self.dispatch_polled(batches))
+        # edge_case_handler 重试多次仍然失败时返回 None
+        result = await super().fetchRawMessage(self.polling_scheduler.count) or []
+        if result:
+          await batches.put(result)
+        delay = self.polling_scheduler.observe(len(result))
+        if delay:
+          await asyncio.sleep(delay)
+    finally:
+      if dispatcher is not None:
+        dispatcher.cancel()
 
+  async def dispatch_polled(self, batches: asyncio.Queue):
+    while True:
+      result = await batches.get()
       try:
-        result  = \
-          await super().fetchMessage(count)
+        selected = [(i, self.prefilter(i)) for i in result]
+        selected = [(i, event_bodys) for i, event_bodys in selected if event_bodys]
+        result = self.parseReceived([i for i, _ in selected])
       except pydantic.ValidationError:
         continue
-      last_length = len(result)
-      latest_result = []
-      while True:
-        if last_length == count:
-          latest_result = await super().fetchMessage(count)
-          last_length = len(latest_result)
-          result += latest_result
-          continue
-        break
-
-      for message_index in range(len(result)):
-        item = result[message_index]
-        await self.queue.put(
+      except Exception:
+        # 一批数据出错不影响之后的批次
+        EventLogger.error("failed to dispatch a polled batch, it has been dropped.")
+        traceback.print_exc()
+        continue
+
+      for item, (_, event_bodys) in zip(result, selected):
+        await self.queue_event(
           InternalEvent(
             name=self.getEventCurrentName(type(item)),
             body=item
-          )
+          ),
+          event_bodys
         )
 
   async def ws_message(self):
@@ -177,22 +296,25 @@ class Mirai(MiraiProtocol):
       ) as ws_connection:
         while True:
           try:
-            received_data = await ws_connection.receive_json()
+            received_data = await ws_connection.receive_json(loads=json_codec.loads)
           except TypeError:
             continue
           if received_data:
             NetworkLogger.debug("received", received_data)
+            event_bodys = self.prefilter(received_data)
+            if not event_bodys:
+              continue
             try:
-              received_data['messageChain'] = MessageChain.parse_obj(received_data['messageChain'])
+              received_data['messageChain'] = MessageChain.lazy(received_data['messageChain'])
               received_data = MessageTypes[received_data['type']].parse_obj(received_data)
             except pydantic.ValidationError:
               SessionLogger.error(f"parse failed: {received_data}")
               traceback.print_exc()
             else:
-              await self.queue.put(InternalEvent(
+              await self.queue_event(InternalEvent(
                 name=self.getEventCurrentName(type(received_data)),
                 body=received_data
-              ))
+              ), event_bodys)
   
   async def ws_event(self):
     from mirai.event.external.enums import ExternalEvents
@@ -202,10 +324,13 @@ class Mirai(MiraiProtocol):
       ) as ws_connection:
         while True:
           try:
-            received_data = await ws_connection.receive_json()
+            received_data = await ws_connection.receive_json(loads=json_codec.loads)
           except TypeError:
             continue
           if received_data:
+            event_bodys = self.prefilter(received_data)
+            if not event_bodys:
+              continue
             try:
               if hasattr(ExternalEvents, received_data['type']):
                   received_data = \
@@ -218,25 +343,40 @@ class Mirai(MiraiProtocol):
               SessionLogger.error(f"parse failed: {received_data}")
               traceback.print_exc()
             else:
-              await self.queue.put(InternalEvent(
+              await self.queue_event(InternalEvent(
                 name=self.getEventCurrentName(type(received_data)),
                 body=received_data
-              ))
+              ), event_bodys)
 
   async def event_runner(self):
+    self.event_dispatcher.start(self.run_event_bodys)
     while True:
       try:
-        event_context: NamedTuple[InternalEvent] = await asyncio.wait_for(self.queue.get(), 3)
+        event_context, event_bodys = await asyncio.wait_for(self.queue.get(), 3)
       except asyncio.TimeoutError:
         continue
 
-      if event_context.name in self.registeredEventNames:
+      if event_bodys is None:
+        if self.dispatch_table is None:
+          self.build_dispatch_table()
+        event_bodys = self.dispatch_table.get(event_context.name)
+      if event_bodys:
         EventLogger.info(f"handling a event: {event_context.name}")
-        for event_body in list(self.event.values())\
-              [self.registeredEventNames.index(event_context.name)]:
-          if event_body:
-            running_loop = asyncio.get_running_loop()
-            running_loop.create_task(self.executor(event_body, event_context))
+        await self.event_dispatcher.submit(event_bodys, event_context)
+
+  async def run_event_bodys(self, event_bodys, event_context):
+    # 同一个事件的所有处理函数共用一个依赖缓存
+    dependency_cache = DependencyCache(self.dependency_stats)
+    for event_body in event_bodys:
+      await self.executor(event_body, event_context, dependency_cache=dependency_cache)
+
+  def build_dispatch_table(self):
+    "把 event 冻结为 事件名 -> 处理函数元组 的字典, 分发事件时只需要一次查找."
+    self.dispatch_table = {
+      self.getEventCurrentName(event_name): tuple(event_bodys)
+      for event_name, event_bodys in self.event.items() if event_bodys
+    }
+    return self.dispatch_table
 
   @staticmethod
   def sort_middlewares(iterator):
@@ -263,7 +403,7 @@ class Mirai(MiraiProtocol):
       else:
         EventLogger.error(f"threw a exception by {event_context.name}, Exception: {exception.__class__.__name__}, and it hasn't been catched!")
         traceback.print_exc()
-      await self.queue.put(InternalEvent(
+      await self.queue_event(InternalEvent(
         name="UnexpectedException",
         body=UnexpectedException(
           error=exception,
@@ -277,7 +417,7 @@ class Mirai(MiraiProtocol):
   async def executor_with_middlewares(self,
     callable, raw_middlewares,
     event_context,
-    lru_cache_sets=None
+    dependency_cache=None
   ):
     middlewares = self.sort_middlewares(raw_middlewares)
     try:
@@ -287,17 +427,19 @@ class Mirai(MiraiProtocol):
         for normal_middleware in middlewares['normal']:
           stack.enter_context(normal_middleware)
       
-      result = await self.executor(
-        ExecutorProtocol(
-          callable=callable,
-          dependencies=self.global_dependencies,
-          middlewares=[]
-        ),
-        event_context,
-        lru_cache_sets=lru_cache_sets
-      )
+        # 全局依赖已经在处理函数的 dependencies 中, 并且在这个事件内有缓存, 这里不再重复添加
+        result = await self.executor(
+          ExecutorProtocol(
+            callable=callable,
+            dependencies=[],
+            middlewares=[]
+          ),
+          event_context,
+          dependency_cache=dependency_cache
+        )
       if result is TRACEBACKED:
         return TRACEBACKED
+      return result
     except exceptions.Cancelled:
       return TRACEBACKED
     except (NameError, TypeError) as e:
@@ -318,72 +460,26 @@ class Mirai(MiraiProtocol):
     executor_protocol: ExecutorProtocol,
     event_context,
     extra_parameter={},
-    lru_cache_sets=None
+    dependency_cache=None
   ):
-    lru_cache_sets = lru_cache_sets or {}
+    if dependency_cache is None:
+      dependency_cache = DependencyCache(self.dependency_stats)
     executor_protocol: ExecutorProtocol
     for depend in executor_protocol.dependencies:
-      if not inspect.isclass(depend.func):
-        depend_func = depend.func
-      elif hasattr(depend.func, "__call__"):
-        depend_func = depend.func.__call__
-      else:
-        raise TypeError("must be callable.")
-
-      if depend_func in lru_cache_sets and depend.cache:
-        depend_func = lru_cache_sets[depend_func]
-      else:
-        if depend.cache:
-          original = depend_func
-          if inspect.iscoroutinefunction(depend_func):
-            depend_func = alru_cache(depend_func)
-          else:
-            depend_func = lru_cache(depend_func)
-          lru_cache_sets[original] = depend_func
-
-      result = await self.executor_with_middlewares(
-        depend_func, depend.middlewares, event_context, lru_cache_sets
-      )
+      result = await self.resolve_dependency(depend, event_context, dependency_cache)
       if result is TRACEBACKED:
         return TRACEBACKED
 
-    ParamSignatures = argument_signature(executor_protocol.callable)
-    PlaceAnnotation = self.get_annotations_mapping()
     CallParams = {}
-    for name, annotation, default in ParamSignatures:
-      if default:
-        if isinstance(default, Depend):
-          if not inspect.isclass(default.func):
-            depend_func = default.func
-          elif hasattr(default.func, "__call__"):
-            depend_func = default.func.__call__
-          else:
-            raise TypeError("must be callable.")
-          
-          if depend_func in lru_cache_sets and default.cache:
-            depend_func = lru_cache_sets[depend_func]
-          else:
-            if default.cache:
-              original = depend_func
-              if inspect.iscoroutinefunction(depend_func):
-                depend_func = alru_cache(depend_func)
-              else:
-                depend_func = lru_cache(depend_func)
-              lru_cache_sets[original] = depend_func
-
-          CallParams[name] = await self.executor_with_middlewares(
-            depend_func, default.middlewares, event_context, lru_cache_sets
-          )
-          continue
-        else:
-          raise RuntimeError("checked a unexpected default value.")
-      else:
-        if annotation in PlaceAnnotation:
-          CallParams[name] = PlaceAnnotation[annotation](event_context)
-          continue
-        else:
-          if name not in extra_parameter:
-            raise RuntimeError(f"checked a unexpected annotation: {annotation}")
+    for name, annotation, getter, depend in self.signature_plan(executor_protocol.callable):
+      if depend is not None:
+        CallParams[name] = await self.resolve_dependency(depend, event_context, dependency_cache)
+        if CallParams[name] is TRACEBACKED:
+          return TRACEBACKED
+      elif getter is not None:
+        CallParams[name] = getter(event_context)
+      elif name not in extra_parameter:
+        raise RuntimeError(f"checked a unexpected annotation: {annotation}")
     
     try:
       async with AsyncExitStack() as stack:
@@ -400,6 +496,43 @@ class Mirai(MiraiProtocol):
       await self.put_exception(event_context, e)
       return TRACEBACKED
 
+  async def resolve_dependency(self, depend: Depend, event_context, dependency_cache: DependencyCache):
+    "执行一个依赖并返回它的结果, cache=True 的依赖在同一个事件中只执行一次."
+    if not inspect.isclass(depend.func):
+      depend_func = depend.func
+    elif hasattr(depend.func, "__call__"):
+      depend_func = depend.func.__call__
+    else:
+      raise TypeError("must be callable.")
+
+    if depend.cache and depend_func in dependency_cache:
+      return dependency_cache.get(depend_func)
+    result = await self.executor_with_middlewares(
+      depend_func, depend.middlewares, event_context, dependency_cache
+    )
+    if depend.cache:
+      dependency_cache.put(depend_func, result)
+    return result
+
+  def signature_plan(self, callable_target: Callable):
+    """把函数的参数编译为 (参数名, 注解, 取值函数, Depend) 的元组, 每个函数只解析一次签名.
+    取值函数和 Depend 都为 None 的参数需要由 extra_parameter 提供.
+    """
+    key = inspect.unwrap(callable_target)
+    plan = self.signature_plans.get(key)
+    if plan is None:
+      place_annotation = self.get_annotations_mapping()
+      plan = []
+      for name, annotation, default in argument_signature(callable_target):
+        if default:
+          if not isinstance(default, Depend):
+            raise RuntimeError("checked a unexpected default value.")
+          plan.append((name, annotation, None, default))
+        else:
+          plan.append((name, annotation, place_annotation.get(annotation), None))
+      plan = self.signature_plans[key] = tuple(plan)
+    return plan
+
   def getRestraintMapping(self):
     from mirai.event.external.enums import ExternalEvents
     return {
@@ -495,6 +628,7 @@ class Mirai(MiraiProtocol):
         dependencies=self.global_dependencies,
         middlewares=self.global_middlewares
       ))
+      self.dispatch_table = None
       
       if exception_class:
         if exception_class not in self.listening_exceptions:
@@ -584,7 +718,7 @@ class Mirai(MiraiProtocol):
       try:
         return await func(app)
       except Exception as e:
-        await self.queue.put(InternalEvent(
+        await self.queue_event(InternalEvent(
           name="UnexpectedException",
           body=UnexpectedException(
             error=e,
@@ -601,9 +735,9 @@ class Mirai(MiraiProtocol):
   @staticmethod
   async def run_func(func, *args, **kwargs):
     if inspect.iscoroutinefunction(func):
-      await func(*args, **kwargs)
+      return await func(*args, **kwargs)
     else:
-      func(*args, **kwargs)
+      return func(*args, **kwargs)
 
   def onStage(self, stage_name):
     def warpper(func):
@@ -624,10 +758,13 @@ class Mirai(MiraiProtocol):
         self.lifecycle.setdefault(life_name, [])
         self.lifecycle[life_name] += items
       self.listening_exceptions += other.listening_exceptions
+      self.commands.include(other.commands)
+    self.dispatch_table = None
 
   def run(self, loop=None, no_polling=False, no_forever=False):
     self.checkEventBodyAnnotations()
     self.checkEventDependencies()
+    self.build_dispatch_table()
 
     loop = loop or asyncio.get_event_loop()
     self.queue = asyncio.Queue(loop=loop)
@@ -683,4 +820,5 @@ class Mirai(MiraiProtocol):
       for end_callable in self.lifecycle['end']:
         loop.run_until_complete(self.run_func(end_callable, self))
 
+      self.event_dispatcher.close()
       loop.run_until_complete(self.release())
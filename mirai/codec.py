@@ -0,0 +1,53 @@
+import json
+import typing as T
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from mirai.logger import Network
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+BACKENDS: T.Dict[str, T.Optional[T.Tuple[T.Callable, T.Callable]]] = {
+    "orjson": (orjson.loads, _orjson_dumps) if orjson else None,
+    "ujson": (ujson.loads, ujson.dumps) if ujson else None,
+    "json": (json.loads, json.dumps)
+}
+
+def available_backends() -> T.List[str]:
+    return [name for name, backend in BACKENDS.items() if backend is not None]
+
+class JsonCodec:
+    """network, protocol 和 websocket 共用的 JSON 编解码.
+
+    默认按 orjson, ujson, json 的顺序使用第一个已安装的库, 可以通过 use 切换.
+    各个库解析失败时抛出的异常都是 ValueError 的子类.
+    """
+    name: str
+    loads: T.Callable[[T.Union[str, bytes]], T.Any]
+    dumps: T.Callable[[T.Any], str]
+
+    def __init__(self, name: T.Optional[str] = None):
+        self.use(name)
+
+    def use(self, name: T.Optional[str] = None):
+        if name is None:
+            name = available_backends()[0]
+        if name not in BACKENDS:
+            raise ValueError(f"unknown json backend: {name}")
+        if BACKENDS[name] is None:
+            raise ValueError(f"json backend {name} is not installed")
+        self.name = name
+        self.loads, self.dumps = BACKENDS[name]
+        Network.debug(f"using json backend: {name}")
+        return self
+
+json_codec = JsonCodec()
@@ -0,0 +1,143 @@
+import inspect
+import sys
+import typing as T
+
+class CommandError(ValueError):
+    "命令参数无法转换为声明的类型."
+    pass
+
+def _converter(annotation) -> T.Callable[[str], T.Any]:
+    if annotation is inspect.Parameter.empty or annotation is str:
+        return str
+    if not callable(annotation):
+        raise TypeError(f"command argument annotation must be callable: {annotation}")
+    return annotation
+
+class Command:
+    """编译好的命令: 处理函数的第一个参数为 dispatch 传入的 context, 其余参数从命令文本中按注解转换.
+
+    注解可以是 int 等类型或者任意接收字符串的函数, 没有注解时为 str; *args 可以接收任意多个参数.
+    参数个数不符时命令不匹配, ignore_extra 为 True 时多出的参数被忽略; 转换失败时抛出 CommandError.
+    guard(context) 在转换参数之前调用, 返回 False 时当作没有匹配, 不会转换参数也不会抛出 CommandError.
+    """
+    def __init__(self,
+        words: T.Tuple[str, ...],
+        func: T.Callable[..., T.Awaitable],
+        guard: T.Optional[T.Callable[[T.Any], bool]] = None,
+        ignore_extra: bool = False
+    ):
+        self.words = words
+        self.func = func
+        self.guard = guard
+        self.converters: T.List[T.Callable[[str], T.Any]] = []
+        self.variadic: T.Optional[T.Callable[[str], T.Any]] = None
+        self.required = 0
+        self.maximum = 0
+
+        parameters = list(inspect.signature(func).parameters.values())[1:]
+        for parameter in parameters:
+            if parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+                self.variadic = _converter(parameter.annotation)
+            elif parameter.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+                self.converters.append(_converter(parameter.annotation))
+                if parameter.default is inspect.Parameter.empty:
+                    self.required += 1
+            elif parameter.default is inspect.Parameter.empty:
+                raise TypeError(f"command {' '.join(words)} can't fill keyword argument: {parameter.name}")
+        self.maximum = sys.maxsize if self.variadic is not None or ignore_extra else len(self.converters)
+
+    def convert(self, args: T.List[str]) -> list:
+        if self.variadic is None:
+            args = args[:len(self.converters)]
+        result = []
+        for index, value in enumerate(args):
+            converter = self.converters[index] if index < len(self.converters) else self.variadic
+            try:
+                result.append(converter(value))
+            except (ValueError, TypeError) as e:
+                raise CommandError(str(e) or f"invaild argument: {value}") from e
+        return result
+
+class CommandRouter:
+    """按 "前缀 子命令" 或单个词查找命令, 每条消息最多两次字典查找.
+
+    第一个词不是任何命令的开头时直接返回, 不会继续分割和查找.
+    """
+    def __init__(self):
+        self.routes: T.Dict[T.Tuple[str, ...], Command] = {}
+        self.first_words: T.Set[str] = set()
+        self.dispatched = 0
+        self.rejected = 0
+        self.guarded = 0
+
+    def register(self,
+        name: str,
+        *aliases: str,
+        prefix: T.Optional[str] = None,
+        guard: T.Optional[T.Callable[[T.Any], bool]] = None,
+        ignore_extra: bool = False
+    ):
+        """prefix 为 None 时 name 本身就是整条命令, 例如 register(\"扫雷\"); 否则匹配 \"prefix name 参数...\".
+        guard 和 ignore_extra 见 Command.
+        """
+        def register_warpper(func: T.Callable[..., T.Awaitable]):
+            if not inspect.iscoroutinefunction(func):
+                raise TypeError("command body must be a coroutine function.")
+            for word in (name,) + aliases:
+                words = (prefix, word) if prefix is not None else (word,)
+                if words in self.routes:
+                    raise ValueError(f"command already registered: {' '.join(words)}")
+                self.routes[words] = Command(words, func, guard, ignore_extra)
+                self.first_words.add(words[0])
+            return func
+        return register_warpper
+
+    def include(self, other: "CommandRouter"):
+        self.routes.update(other.routes)
+        self.first_words |= other.first_words
+
+    def match(self, text: str) -> T.Optional[T.Tuple[Command, T.List[str]]]:
+        "返回匹配的命令和未转换的参数, 没有匹配时返回 None."
+        head = text.split(None, 1)
+        if not head or head[0] not in self.first_words:
+            return None
+        words = text.split()
+        if len(words) > 1:
+            command = self.routes.get((words[0], words[1]))
+            if command is not None and command.required <= len(words) - 2 <= command.maximum:
+                return command, words[2:]
+        command = self.routes.get((words[0],))
+        if command is not None and command.required <= len(words) - 1 <= command.maximum:
+            return command, words[1:]
+        return None
+
+    async def dispatch(self, text: str, context) -> bool:
+        "执行 text 对应的命令, 返回是否有命令匹配. 参数转换失败时抛出 CommandError."
+        matched = self.match(text)
+        if matched is None:
+            self.rejected += 1
+            return False
+        command, args = matched
+        if command.guard is not None and not command.guard(context):
+            self.guarded += 1
+            return False
+        args = command.convert(args)
+        self.dispatched += 1
+        await command.func(context, *args)
+        return True
+
+    def pre_filter(self, received_data: dict) -> bool:
+        "用作 receiver 的 pre_filter: 原始消息中第一个 Plain 的第一个词是某个命令的开头时放行."
+        for component in received_data.get('messageChain') or []:
+            if component.get('type') == "Plain":
+                words = component.get('text', "").split(None, 1)
+                return bool(words) and words[0] in self.first_words
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "commands": len(self.routes),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "guarded": self.guarded
+        }
@@ -2,4 +2,25 @@ class Depend:
     def __init__(self, func, middlewares=[], cache=True):
         self.func = func
         self.middlewares = middlewares
-        self.cache = cache
\ No newline at end of file
+        self.cache = cache
+
+class DependencyCache:
+    """一个事件范围内的依赖缓存.
+
+    cache=True 的依赖在同一个事件中只会执行一次, 结果 (包括被 Cancelled) 由这个事件的所有处理函数共享.
+    stats 为 {"hits": int, "misses": int}, 传入时命中和未命中的次数会累加到里面.
+    """
+    def __init__(self, stats: dict = None):
+        self.results = {}
+        self.stats = stats if stats is not None else {"hits": 0, "misses": 0}
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key):
+        self.stats["hits"] += 1
+        return self.results[key]
+
+    def put(self, key, value):
+        self.stats["misses"] += 1
+        self.results[key] = value
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import traceback
+import typing as T
+
+from mirai.logger import Event as EventLogger
+
+OVERFLOW_POLICIES = ("block", "drop", "shed_oldest")
+
+def sender_key(event_context) -> T.Optional[T.Hashable]:
+    "消息事件按发送者分片, 没有发送者的事件返回 None."
+    sender = getattr(event_context.body, "sender", None)
+    return getattr(sender, "id", None)
+
+class EventDispatcher:
+    """固定数量的 worker 协程执行事件处理函数, 每个 worker 有自己的队列.
+
+    key(event_context) 相同的事件总是进入同一个队列, 按收到的顺序依次执行, 所以同一个玩家的两条命令不会乱序;
+    key 为 None 的事件轮流分配到各个队列. 同时执行的事件数最多为 workers.
+    队列满时按 overflow 处理: block 等待空位, drop 丢弃新事件,
+    shed_oldest 丢弃同一个 key 在队列中最旧的事件, 不会丢掉同一个队列里其它发送者的事件; 这个 key 没有排队的事件时丢弃新事件.
+    """
+    def __init__(self,
+        workers: int = 16,
+        queue_size: int = 1000,
+        overflow: str = "block",
+        key: T.Callable[[T.Any], T.Optional[T.Hashable]] = sender_key
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.key = key
+        self.queues: T.List[asyncio.Queue] = []
+        self.tasks: T.List[asyncio.Task] = []
+        self.round_robin = itertools.count()
+        self.processed = 0
+        self.dropped = 0
+        self.shed = 0
+
+    @property
+    def depths(self) -> T.List[int]:
+        "每个队列中等待执行的事件数."
+        return [queue.qsize() for queue in self.queues]
+
+    def stats(self) -> dict:
+        depths = self.depths
+        return {
+            "depths": depths,
+            "total_depth": sum(depths),
+            "max_depth": max(depths, default=0),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "shed": self.shed
+        }
+
+    def start(self, run: T.Callable[[T.Any, T.Any], T.Awaitable]):
+        "run(event_bodys, event_context) 为执行一个事件的所有处理函数的协程函数."
+        if self.tasks:
+            return
+        self.queues = [asyncio.Queue(self.queue_size) for _ in range(self.workers)]
+        self.tasks = [asyncio.ensure_future(self.worker(queue, run)) for queue in self.queues]
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def submit(self, event_bodys, event_context) -> bool:
+        "返回 False 表示事件因为队列已满被丢弃."
+        key = self.key(event_context)
+        if key is None:
+            queue = self.queues[next(self.round_robin) % self.workers]
+        else:
+            queue = self.queues[hash(key) % self.workers]
+
+        if queue.full():
+            if self.overflow == "shed_oldest":
+                shed = self.shed_oldest(queue, key)
+                if shed is not None:
+                    self.shed += 1
+                    EventLogger.warning(f"event queue is full, dropped the oldest queued event of the same sender: {shed[1].name}")
+            if queue.full() and self.overflow != "block":
+                self.dropped += 1
+                EventLogger.warning(f"event queue is full, dropped a event: {event_context.name}")
+                return False
+        await queue.put((event_bodys, event_context, key))
+        return True
+
+    @staticmethod
+    def shed_oldest(queue: asyncio.Queue, key):
+        "从队列中移除 key 相同的最旧的事件并返回它, 没有时返回 None; 其它事件保持原来的顺序."
+        items = [queue.get_nowait() for _ in range(queue.qsize())]
+        shed = None
+        for index, item in enumerate(items):
+            if item[2] == key:
+                shed = items.pop(index)
+                break
+        for item in items:
+            queue.put_nowait(item)
+        return shed
+
+    async def worker(self, queue: asyncio.Queue, run):
+        while True:
+            event_bodys, event_context, _ = await queue.get()
+            try:
+                await run(event_bodys, event_context)
+            except Exception:
+                EventLogger.error(f"dispatcher worker catched a exception by {event_context.name}")
+                traceback.print_exc()
+            self.processed += 1
@@ -6,6 +6,8 @@ class ExecutorProtocol(BaseModel):
     callable: T.Callable
     dependencies: T.List[Depend]
     middlewares: T.List
+    # 在解析之前对收到的原始数据调用, 返回 False 表示这个事件与它无关
+    pre_filter: T.Optional[T.Callable[[dict], bool]] = None
 
     class Config:
         arbitrary_types_allowed = True
\ No newline at end of file
@@ -1,13 +1,25 @@
 import typing as T
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from .base import BaseMessageComponent
 from mirai.misc import raiser, printer, if_error_print_arg
 from .components import Source
 from mirai.logger import Protocol
 
+def component_type_name(component_class) -> str:
+    "组件类对应的 mirai-api-http 中的 type 字段."
+    default = component_class.__fields__['type'].default
+    return getattr(default, "value", default)
+
 class MessageChain(BaseModel):
     __root__: T.List[BaseMessageComponent] = []
+    # 由 lazy 创建时保存原始数据, 组件在第一次访问时才逐个解析
+    _raw: T.Optional[T.List[dict]] = PrivateAttr(None)
+    _parsed: T.Optional[T.List[T.Optional[BaseMessageComponent]]] = PrivateAttr(None)
+
+    class Config:
+        # 作为 GroupMessage 等的字段时不复制, 否则还没解析的原始数据会丢失
+        copy_on_model_validation = "none"
 
     def __add__(self, value):
         if isinstance(value, BaseMessageComponent):
@@ -18,7 +30,24 @@ class MessageChain(BaseModel):
             return self
 
     def toString(self) -> str:
-        return "".join([i.toString() for i in self.__root__])
+        if self._raw is None:
+            return "".join([i.toString() for i in self.__root__])
+        result = []
+        for index, item in enumerate(self._raw):
+            component_type = item.get('type')
+            if component_type == "Plain":
+                result.append(item['text'])
+            elif component_type in ("Source", "Quote", "Unknown"):
+                continue
+            elif component_type == "At":
+                result.append(f"[At::target={item['target']}]")
+            elif component_type == "AtAll":
+                result.append("[AtAll]")
+            elif component_type == "Face":
+                result.append(f"[Face::name={item.get('name')}]")
+            else:
+                result.append(self.__component(index).toString())
+        return "".join(result)
 
     @classmethod
     def parse_obj(cls, obj):
@@ -34,13 +63,69 @@ class MessageChain(BaseModel):
                 raise
         return cls(__root__=result)
 
+    @classmethod
+    def lazy(cls, obj):
+        """保留原始的 messageChain 列表, 不在收到消息时解析.
+
+        getFirstComponent, getAllofComponent, hasComponent 和 toString 直接在原始数据上查找,
+        只解析需要返回的组件; 其它方式访问 __root__ 时才解析全部组件.
+        """
+        if not isinstance(obj, list) or not all(isinstance(i, dict) for i in obj):
+            raise TypeError("invaild value")
+        chain = cls.__new__(cls)
+        object.__setattr__(chain, '__dict__', {})
+        object.__setattr__(chain, '__fields_set__', {'__root__'})
+        chain._init_private_attributes()
+        chain._raw = obj
+        chain._parsed = [None] * len(obj)
+        return chain
+
+    def __getattr__(self, name):
+        # lazy 创建的 MessageChain 在 __dict__ 中没有 __root__, 第一次访问时解析全部组件
+        if name == '__root__' and self._raw is not None:
+            root = [self.__component(i) for i in range(len(self._raw))]
+            self.__dict__['__root__'] = root
+            self._raw = self._parsed = None
+            return root
+        raise AttributeError(name)
+
+    def __component(self, index: int) -> BaseMessageComponent:
+        from .components import MessageComponents
+        if self._parsed[index] is None:
+            item = self._raw[index]
+            try:
+                self._parsed[index] = MessageComponents[item['type']].parse_obj(item)
+            except:
+                Protocol.error(f"error throwed by message serialization: {item.get('type')}, it's {item}")
+                raise
+        return self._parsed[index]
+
+    def __indexes_of(self, component_class) -> T.Iterator[int]:
+        type_name = component_type_name(component_class)
+        return (index for index, item in enumerate(self._raw) if item.get('type') == type_name)
+
+    def _iter(self, *args, **kwargs):
+        # dict(), json() 和 == 都经过这里, 需要先解析全部组件
+        self.__root__
+        return super()._iter(*args, **kwargs)
+
+    def __repr_args__(self):
+        self.__root__
+        return super().__repr_args__()
+
     def __iter__(self):
-        yield from self.__root__
+        if self._raw is None:
+            yield from self.__root__
+        else:
+            for index in range(len(self._raw)):
+                yield self.__component(index)
 
     def __getitem__(self, index):
         return self.__root__[index]
 
     def hasComponent(self, component_class) -> bool:
+        if self._raw is not None:
+            return next(self.__indexes_of(component_class), None) is not None
         for i in self:
             if type(i) == component_class:
                 return True
@@ -48,18 +133,25 @@ class MessageChain(BaseModel):
             return False
 
     def __len__(self) -> int:
+        if self._raw is not None:
+            return len(self._raw)
         return len(self.__root__)
 
     def getFirstComponent(self, component_class) -> T.Optional[BaseMessageComponent]:
+        if self._raw is not None:
+            index = next(self.__indexes_of(component_class), None)
+            return self.__component(index) if index is not None else None
         for i in self:
             if type(i) == component_class:
                 return i
 
     def getAllofComponent(self, component_class) -> T.List[BaseMessageComponent]:
+        if self._raw is not None:
+            return [self.__component(index) for index in self.__indexes_of(component_class)]
         return [i for i in self if type(i) == component_class]
 
     def getSource(self) -> Source:
         return self.getFirstComponent(Source)
 
     __contains__ = hasComponent
-    __getitem__ = getAllofComponent
\ No newline at end of file
+    __getitem__ = getAllofComponent
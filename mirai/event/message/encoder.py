@@ -0,0 +1,62 @@
+import datetime
+import typing as T
+from enum import Enum
+from functools import lru_cache
+
+from .base import BaseMessageComponent
+from .chain import MessageChain
+from .components import Plain, At, AtAll, Face
+
+__all__ = [
+    "encode_component",
+    "encode_chain"
+]
+
+# 直接把消息组件转换为 mirai-api-http 接受的 dict, 结果与 json.loads(component.json()) 相同,
+# 但不需要先序列化成字符串再解析回来.
+# 返回的 dict 可能是缓存中的同一个对象, 调用方不能修改它.
+
+def encode_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, BaseMessageComponent):
+        return encode_component(value)
+    elif isinstance(value, MessageChain):
+        return encode_chain(value)
+    elif isinstance(value, (list, tuple)):
+        return [encode_value(i) for i in value]
+    elif isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    return value
+
+@lru_cache(maxsize=1024)
+def encode_plain(text: str) -> dict:
+    "Plain 只有文本, 相同的文本 (比如固定的帮助信息) 只编码一次."
+    return {"type": "Plain", "text": text}
+
+@lru_cache(maxsize=1024)
+def encode_at(target: int, display: T.Optional[str]) -> dict:
+    return {"type": "At", "target": target, "display": display}
+
+@lru_cache(maxsize=256)
+def encode_face(faceId: int, name: T.Optional[str]) -> dict:
+    return {"type": "Face", "faceId": faceId, "name": name}
+
+ENCODED_AT_ALL = {"type": "AtAll"}
+
+def encode_component(component: BaseMessageComponent) -> dict:
+    component_type = type(component)
+    if component_type is Plain:
+        return encode_plain(component.text)
+    elif component_type is At:
+        return encode_at(component.target, component.display)
+    elif component_type is AtAll:
+        return ENCODED_AT_ALL
+    elif component_type is Face:
+        return encode_face(component.faceId, component.name)
+    return {k: encode_value(v) for k, v in component.__dict__.items()}
+
+def encode_chain(chain: T.Union[MessageChain, T.Iterable[BaseMessageComponent]]) -> T.List[dict]:
+    return [encode_component(i) for i in chain]
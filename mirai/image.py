@@ -1,6 +1,11 @@
 from pathlib import Path
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 import base64
+import hashlib
+import time
+import typing as T
 
 class InternalImage(metaclass=ABCMeta):
     @abstractmethod
@@ -11,6 +16,14 @@ class InternalImage(metaclass=ABCMeta):
     def render(self) -> bytes:
         pass
 
+    @contextmanager
+    def open(self) -> T.Iterator[T.Union[bytes, memoryview, T.BinaryIO]]:
+        """以尽量不复制的方式取得图片内容, 用于上传.
+
+        产出 bytes, memoryview 或者二进制文件对象, 退出时释放.
+        """
+        yield self.render()
+
 class LocalImage(InternalImage):
     path: Path
     flash: bool = False
@@ -25,6 +38,11 @@ class LocalImage(InternalImage):
     def render(self) -> bytes:
         return self.path.read_bytes()
 
+    @contextmanager
+    def open(self) -> T.Iterator[T.BinaryIO]:
+        with self.path.open("rb") as file:
+            yield file
+
 class IOImage(InternalImage):
     def __init__(self, IO, flash: bool = False):
         """make a object with 'read' method a image.
@@ -37,6 +55,18 @@ class IOImage(InternalImage):
     def render(self) -> bytes:
         return self.IO.getvalue()
 
+    @contextmanager
+    def open(self) -> T.Iterator[T.Union[bytes, memoryview]]:
+        if not hasattr(self.IO, "getbuffer"):
+            yield self.render()
+            return
+        # BytesIO.getbuffer 不会复制数据, 但在释放之前 IO 不能被改变大小
+        view = self.IO.getbuffer()
+        try:
+            yield view
+        finally:
+            view.release()
+
 class BytesImage(InternalImage):
     def __init__(self, data: bytes, flash: bool = False):
         self.data = data
@@ -52,3 +82,74 @@ class Base64Image(InternalImage):
     
     def render(self) -> bytes:
         return base64.b64decode(self.base64_str)
+
+
+class ImageUploadCache:
+    """已上传图片的缓存, 以 (内容摘要, 上传类型) 为键记录服务器返回的 Image.
+
+    max_size - 最多缓存的图片数, 超出时淘汰最久没有用到的.
+    ttl - 缓存的秒数, 为 None 时不过期.
+    """
+    def __init__(self, max_size: int = 256, ttl: T.Optional[float] = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[T.Tuple[str, str], T.Tuple[T.Any, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(source: T.Union[bytes, memoryview, T.BinaryIO], upload_type: str) -> T.Tuple[str, str]:
+        "source 为 InternalImage.open 产出的内容, 文件对象会被分块读取后移回原来的位置."
+        digest = hashlib.sha256()
+        if hasattr(source, "read"):
+            position = source.tell()
+            for chunk in iter(lambda: source.read(65536), b""):
+                digest.update(chunk)
+            source.seek(position)
+        else:
+            digest.update(source)
+        return digest.hexdigest(), upload_type
+
+    def get(self, key: T.Tuple[str, str]):
+        entry = self._entries.get(key)
+        if entry is not None:
+            image, expire_at = entry
+            if expire_at is None or expire_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: T.Tuple[str, str], image):
+        self._entries[key] = (image, time.monotonic() + self.ttl if self.ttl is not None else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, image_ids: T.Iterable[str]) -> int:
+        "移除给定 imageId 对应的缓存, 用于服务器不再接受这些 id 的时候, 返回移除的数量."
+        image_ids = {self.normalize_id(i) for i in image_ids}
+        stale = [key for key, (image, _) in self._entries.items()
+            if self.normalize_id(image.imageId) in image_ids]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    @staticmethod
+    def normalize_id(image_id: str) -> str:
+        "把群图片的 {xxx}.mirai 和好友图片的 /xxx 统一为不带修饰的大写 id."
+        if image_id.startswith("{"):
+            image_id = image_id[1:].split("}", 1)[0]
+        return image_id.lstrip("/").upper()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
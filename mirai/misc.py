@@ -210,3 +210,14 @@ def argument_signature(callable_target) -> T.List[Parameter]:
         )
         for name, param in dict(inspect.signature(callable_target).parameters).items()
     ]
+
+def plain_prefix_filter(*prefixes: str, equals: T.Iterable[str] = ()):
+  "用作 receiver 的 pre_filter: 原始消息中第一个 Plain 的文本以 prefixes 之一开头, 或等于 equals 之一时放行."
+  equals = frozenset(equals)
+  def pre_filter(received_data: dict) -> bool:
+    for component in received_data.get('messageChain') or []:
+      if component.get('type') == "Plain":
+        text = component.get('text', "")
+        return text in equals or text.startswith(prefixes)
+    return False
+  return pre_filter
@@ -1,47 +1,107 @@
-import json
 import mimetypes
 import typing as T
+from contextlib import asynccontextmanager
 from pathlib import Path
 from .logger import Network
 
 import aiohttp
 
+from mirai.codec import json_codec
 from mirai.exceptions import NetworkError
 
+@asynccontextmanager
+async def session_scope(session: T.Optional[aiohttp.ClientSession] = None):
+    "有传入长连接的 session 时直接使用, 否则为这一次请求临时创建一个."
+    if session is not None:
+        yield session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
 class fetch:
     @staticmethod
-    async def http_post(url, data_map):
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data_map) as response:
+    async def http_post(url, data_map, session: T.Optional[aiohttp.ClientSession] = None):
+        async with session_scope(session) as session:
+            async with session.post(url, data=json_codec.dumps(data_map), headers={
+                "Content-Type": "application/json"
+            }) as response:
                 data = await response.text(encoding="utf-8")
                 Network.debug(f"requested url={url}, by data_map={data_map}, and status={response.status}, data={data}")
                 response.raise_for_status()
         try:
-            return json.loads(data)
-        except json.decoder.JSONDecodeError:
+            return json_codec.loads(data)
+        except ValueError:
             Network.error(f"requested {url} with {data_map}, responsed {data}, decode failed...")
 
     @staticmethod
-    async def http_get(url, params=None): 
-        async with aiohttp.ClientSession() as session:
+    async def http_get(url, params=None, session: T.Optional[aiohttp.ClientSession] = None):
+        async with session_scope(session) as session:
             async with session.get(url, params=params) as response:
                 response.raise_for_status()
                 data = await response.text(encoding="utf-8")
                 Network.debug(f"requested url={url}, by params={params}, and status={response.status}, data={data}")
         try:
-            return json.loads(data)
-        except json.decoder.JSONDecodeError:
+            return json_codec.loads(data)
+        except ValueError:
             Network.error(f"requested {url} with {params}, responsed {data}, decode failed...")
 
     @staticmethod
-    async def upload(url, filedata: bytes, addon_dict: dict):
+    async def upload(url,
+        filedata: T.Union[bytes, memoryview, T.BinaryIO],
+        addon_dict: dict,
+        session: T.Optional[aiohttp.ClientSession] = None
+    ):
+        "filedata 为文件对象时按块流式上传, 为 memoryview 时直接写出而不复制."
         upload_data = aiohttp.FormData()
         upload_data.add_field("img", filedata)
         for item in addon_dict.items():
             upload_data.add_fields(item)
 
-        async with aiohttp.ClientSession() as session:
+        async with session_scope(session) as session:
             async with session.post(url, data=upload_data) as response:
                 response.raise_for_status()
                 Network.debug(f"requested url={url}, and status={response.status}, addon_dict={addon_dict}")
-                return await response.text("utf-8")
\ No newline at end of file
+                return await response.text("utf-8")
+
+class PooledFetch:
+    """与 fetch 有相同接口, 但所有请求共用一个长连接的 ClientSession.
+
+    limit - 连接池中最多同时保持的连接数.
+    keepalive_timeout - 空闲连接保持的秒数.
+    timeout - 单个请求的总超时秒数, 为 None 时不限制.
+    """
+    session: T.Optional[aiohttp.ClientSession] = None
+
+    def __init__(self, limit: int = 100, keepalive_timeout: float = 15, timeout: T.Optional[float] = 60):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+
+    @property
+    def opened(self) -> bool:
+        return self.session is not None and not self.session.closed
+
+    async def open(self):
+        if not self.opened:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    keepalive_timeout=self.keepalive_timeout
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self
+
+    async def close(self):
+        if self.opened:
+            await self.session.close()
+        self.session = None
+
+    async def http_post(self, url, data_map):
+        return await fetch.http_post(url, data_map, session=self.session)
+
+    async def http_get(self, url, params=None):
+        return await fetch.http_get(url, params, session=self.session)
+
+    async def upload(self, url, filedata: T.Union[bytes, memoryview, T.BinaryIO], addon_dict: dict):
+        return await fetch.upload(url, filedata, addon_dict, session=self.session)
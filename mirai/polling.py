@@ -0,0 +1,52 @@
+class PollingScheduler:
+    """HTTP 轮询模式下决定每次 fetchMessage 拉取的数量和两次拉取之间的间隔.
+
+    拉满 count 条说明服务端还有积压, 立即再拉一次并把 count 翻倍 (不超过 max_count);
+    拉到消息但没有拉满时在 min_interval 后继续拉, count 逐渐缩回 min_count;
+    没有消息时间隔从 min_interval 开始按 backoff 倍数增长, 最长 max_interval.
+    max_interval 默认与原来固定的 0.5 秒相同, 空闲时的请求频率和最坏情况下的延迟都不会比原来差.
+    """
+    def __init__(self,
+        min_interval: float = 0.02,
+        max_interval: float = 0.5,
+        backoff: float = 2.0,
+        min_count: int = 10,
+        max_count: int = 200
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.min_count = min_count
+        self.max_count = max_count
+        self.count = min_count
+        self.interval = min_interval
+        self.polls = 0
+        self.empty_polls = 0
+        self.fetched = 0
+
+    def observe(self, fetched: int) -> float:
+        "记录这一次拉取到的数量, 返回下一次拉取前需要等待的秒数."
+        self.polls += 1
+        self.fetched += fetched
+        if fetched >= self.count:
+            self.count = min(self.count * 2, self.max_count)
+            self.interval = self.min_interval
+            return 0.0
+        if fetched:
+            if fetched <= self.count // 2:
+                self.count = max(self.count // 2, self.min_count)
+            self.interval = self.min_interval
+            return self.min_interval
+        self.empty_polls += 1
+        delay = self.interval
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "polls": self.polls,
+            "empty_polls": self.empty_polls,
+            "fetched": self.fetched,
+            "count": self.count,
+            "interval": self.interval
+        }
@@ -1,4 +1,4 @@
-import json
+import asyncio
 import re
 import threading
 import traceback
@@ -9,6 +9,7 @@ from uuid import UUID
 
 import pydantic
 
+from mirai.codec import json_codec
 from mirai.entities.friend import Friend
 from mirai.entities.group import (Group, GroupSetting, Member,
                                   MemberChangeableSetting)
@@ -21,14 +22,17 @@ from mirai.event.enums import (
 from mirai.event.message import components
 from mirai.event.message.base import BaseMessageComponent
 from mirai.event.message.chain import MessageChain
+from mirai.event.message.encoder import encode_chain, encode_component, encode_plain
 from mirai.event.message.models import (BotMessage, FriendMessage,
                                         GroupMessage, MessageTypes)
-from mirai.image import InternalImage
+from mirai.image import InternalImage, ImageUploadCache
 from mirai.logger import Protocol as ProtocolLogger
 from mirai.misc import (ImageRegex, ImageType, assertOperatorSuccess,
                         edge_case_handler, getMatchedString, printer,
                         protocol_log, raiser, throw_error_if_not_enable)
-from mirai.network import fetch
+from mirai.network import fetch, PooledFetch
+from mirai.ratelimit import SendQueue
+from mirai import exceptions
 
 # 与 mirai 的 Command 部分将由 mirai.command 模块进行魔法支持,
 # 并尽量的兼容 mirai-console 的内部机制.
@@ -38,12 +42,22 @@ class MiraiProtocol:
     baseurl: str
     session_key: str
     auth_key: str
+    http_pool: T.Optional[PooledFetch] = None
+    image_cache: T.Optional[ImageUploadCache] = None
+    send_queue: T.Optional[SendQueue] = None
+
+    @property
+    def fetch(self):
+        "连接池打开时所有请求都走同一个长连接 session, 否则退回到每次请求新建 session 的 fetch."
+        if self.http_pool is not None and self.http_pool.opened:
+            return self.http_pool
+        return fetch
 
     @protocol_log
     @edge_case_handler
     async def auth(self):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/auth", {
+            await self.fetch.http_post(f"{self.baseurl}/auth", {
                 "authKey": self.auth_key
             }
         ), raise_exception=True, return_as_is=True)
@@ -52,7 +66,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def verify(self):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/verify", {
+            await self.fetch.http_post(f"{self.baseurl}/verify", {
                 "sessionKey": self.session_key,
                 "qq": self.qq
             }
@@ -62,18 +76,22 @@ class MiraiProtocol:
     @protocol_log
     @edge_case_handler
     async def release(self):
-        return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/release", {
-                "sessionKey": self.session_key,
-                "qq": self.qq
-            }
-        ), raise_exception=True)
+        try:
+            return assertOperatorSuccess(
+                await self.fetch.http_post(f"{self.baseurl}/release", {
+                    "sessionKey": self.session_key,
+                    "qq": self.qq
+                }
+            ), raise_exception=True)
+        finally:
+            if self.http_pool is not None:
+                await self.http_pool.close()
 
     @throw_error_if_not_enable
     @edge_case_handler
     async def getConfig(self) -> dict:
         return assertOperatorSuccess(
-            await fetch.http_get(f"{self.baseurl}/config", {
+            await self.fetch.http_get(f"{self.baseurl}/config", {
                 "sessionKey": self.session_key
             }
         ), raise_exception=True, return_as_is=True)
@@ -85,7 +103,7 @@ class MiraiProtocol:
         enableWebsocket=None
     ):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/config", {
+            await self.fetch.http_post(f"{self.baseurl}/config", {
                 "sessionKey": self.session_key,
                 **({
                     "cacheSize": cacheSize
@@ -106,15 +124,24 @@ class MiraiProtocol:
             BaseMessageComponent,
             T.List[T.Union[BaseMessageComponent, InternalImage]],
             str
-        ]
+        ],
+        priority: int = 0,
+        coalesceKey: T.Optional[T.Hashable] = None
     ) -> BotMessage:
-        return BotMessage.parse_obj(assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/sendFriendMessage", {
-                "sessionKey": self.session_key,
-                "target": self.handleTargetAsFriend(friend),
-                "messageChain": await self.handleMessageAsFriend(message)
-            }
-        ), raise_exception=True, return_as_is=True))
+        target = self.handleTargetAsFriend(friend)
+
+        async def post(messageChain):
+            return BotMessage.parse_obj(assertOperatorSuccess(
+                await self.fetch.http_post(f"{self.baseurl}/sendFriendMessage", {
+                    "sessionKey": self.session_key,
+                    "target": target,
+                    "messageChain": messageChain
+                }
+            ), raise_exception=True, return_as_is=True))
+
+        async def send():
+            return await self.sendWithImageRetry(message, "friend", post)
+        return await self.queueSend(("friend", target), send, priority, coalesceKey)
 
     @throw_error_if_not_enable
     @protocol_log
@@ -127,18 +154,27 @@ class MiraiProtocol:
             T.List[T.Union[BaseMessageComponent, InternalImage]],
             str
         ],
-        quoteSource: T.Union[int, components.Source]=None
+        quoteSource: T.Union[int, components.Source]=None,
+        priority: int = 0,
+        coalesceKey: T.Optional[T.Hashable] = None
     ) -> BotMessage:
-        return BotMessage.parse_obj(assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/sendGroupMessage", {
-                "sessionKey": self.session_key,
-                "target": self.handleTargetAsGroup(group),
-                "messageChain": await self.handleMessageAsGroup(message),
-                **({"quote": quoteSource.id \
-                    if isinstance(quoteSource, components.Source) else quoteSource}\
-                if quoteSource else {})
-            }
-        ), raise_exception=True, return_as_is=True))
+        target = self.handleTargetAsGroup(group)
+
+        async def post(messageChain):
+            return BotMessage.parse_obj(assertOperatorSuccess(
+                await self.fetch.http_post(f"{self.baseurl}/sendGroupMessage", {
+                    "sessionKey": self.session_key,
+                    "target": target,
+                    "messageChain": messageChain,
+                    **({"quote": quoteSource.id \
+                        if isinstance(quoteSource, components.Source) else quoteSource}\
+                    if quoteSource else {})
+                }
+            ), raise_exception=True, return_as_is=True))
+
+        async def send():
+            return await self.sendWithImageRetry(message, "group", post)
+        return await self.queueSend(("group", target), send, priority, coalesceKey)
 
     @throw_error_if_not_enable
     @protocol_log
@@ -152,25 +188,86 @@ class MiraiProtocol:
             T.List[T.Union[BaseMessageComponent, InternalImage]],
             str
         ],
-        quoteSource: T.Union[int, components.Source]=None
+        quoteSource: T.Union[int, components.Source]=None,
+        priority: int = 0,
+        coalesceKey: T.Optional[T.Hashable] = None
     ) -> BotMessage:
-        return BotMessage.parse_obj(assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/sendTempMessage", {
-                "sessionKey": self.session_key,
-                "qq": (member.id if isinstance(member, Member) else member),
-                "group": (group.id if isinstance(group, Group) else group),
-                "messageChain": await self.handleMessageForTempMessage(message),
-                **({"quote": quoteSource.id \
-                    if isinstance(quoteSource, components.Source) else quoteSource}\
-                if quoteSource else {})
-            }
-        ), raise_exception=True, return_as_is=True))
+        target = (member.id if isinstance(member, Member) else member)
+
+        async def post(messageChain):
+            return BotMessage.parse_obj(assertOperatorSuccess(
+                await self.fetch.http_post(f"{self.baseurl}/sendTempMessage", {
+                    "sessionKey": self.session_key,
+                    "qq": target,
+                    "group": (group.id if isinstance(group, Group) else group),
+                    "messageChain": messageChain,
+                    **({"quote": quoteSource.id \
+                        if isinstance(quoteSource, components.Source) else quoteSource}\
+                    if quoteSource else {})
+                }
+            ), raise_exception=True, return_as_is=True))
+
+        async def send():
+            return await self.sendWithImageRetry(message, "temp", post)
+        return await self.queueSend(("temp", target), send, priority, coalesceKey)
+
+    @throw_error_if_not_enable
+    async def sendMessages(self,
+        items: T.Iterable[T.Tuple[
+            T.Union[Group, Friend, Member],
+            T.Union[
+                MessageChain,
+                BaseMessageComponent,
+                T.List[T.Union[BaseMessageComponent, InternalImage]],
+                str
+            ]
+        ]],
+        concurrency: int = 8
+    ) -> T.List[T.Union[BotMessage, Exception]]:
+        """批量发送消息, 最多同时发送 concurrency 条.
+
+        items 中的目标为 Group 时发送群消息, 为 Friend 时发送好友消息, 为 Member 时发送临时消息.
+        同一个 InternalImage 对象在同一种上传类型下只会上传一次.
+        返回值与 items 一一对应, 发送失败的项为对应的异常.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        uploads: T.Dict[T.Tuple[int, str], asyncio.Future] = {}
+
+        async def upload_once(image: InternalImage, upload_type: str):
+            key = (id(image), upload_type)
+            if key not in uploads:
+                uploads[key] = asyncio.ensure_future(self.uploadImage(upload_type, image))
+            uploaded = await uploads[key]
+            return uploaded.asFlashImage() if image.flash else uploaded
+
+        async def send(target, message):
+            async with semaphore:
+                if isinstance(target, Group):
+                    upload_type, sender = "group", self.sendGroupMessage
+                elif isinstance(target, Friend):
+                    upload_type, sender = "friend", self.sendFriendMessage
+                elif isinstance(target, Member):
+                    upload_type, sender = "temp", lambda member, chain: \
+                        self.sendTempMessage(member.group, member, chain)
+                else:
+                    raise ValueError(f"invaild target: {target}")
+                if isinstance(message, (tuple, list)):
+                    message = [
+                        (await upload_once(i, upload_type)) if isinstance(i, InternalImage) else i
+                        for i in message
+                    ]
+                return await sender(target, message)
+
+        return await asyncio.gather(
+            *[send(target, message) for target, message in items],
+            return_exceptions=True
+        )
 
     @throw_error_if_not_enable
     @protocol_log
     @edge_case_handler
     async def revokeMessage(self, source: T.Union[components.Source, BotMessage, int]):
-        return assertOperatorSuccess(await fetch.http_post(f"{self.baseurl}/recall", {
+        return assertOperatorSuccess(await self.fetch.http_post(f"{self.baseurl}/recall", {
             "sessionKey": self.session_key,
             "target": source if isinstance(source, int) else source.id \
                 if isinstance(source, components.Source) else source.messageId\
@@ -183,7 +280,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def groupList(self) -> T.List[Group]:
         return [Group.parse_obj(group_info) \
-            for group_info in await fetch.http_get(f"{self.baseurl}/groupList", {
+            for group_info in await self.fetch.http_get(f"{self.baseurl}/groupList", {
                 "sessionKey": self.session_key
             })
         ]
@@ -193,7 +290,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def friendList(self) -> T.List[Friend]:
         return [Friend.parse_obj(friend_info) \
-            for friend_info in await fetch.http_get(f"{self.baseurl}/friendList", {
+            for friend_info in await self.fetch.http_get(f"{self.baseurl}/friendList", {
                 "sessionKey": self.session_key
             })
         ]
@@ -203,7 +300,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def memberList(self, target: int) -> T.List[Member]:
         return [Member.parse_obj(member_info) \
-            for member_info in await fetch.http_get(f"{self.baseurl}/memberList", {
+            for member_info in await self.fetch.http_get(f"{self.baseurl}/memberList", {
                 "sessionKey": self.session_key,
                 "target": target
             })
@@ -219,38 +316,55 @@ class MiraiProtocol:
     @protocol_log
     @edge_case_handler
     async def uploadImage(self, type: T.Union[str, ImageType], image: InternalImage):
-        post_result = json.loads(await fetch.upload(f"{self.baseurl}/uploadImage", image.render(), {
-            "sessionKey": self.session_key,
-            "type": type if isinstance(type, str) else type.value
-        }))
-        return components.Image(**post_result)
+        type = type if isinstance(type, str) else type.value
+        with image.open() as source:
+            if self.image_cache is not None:
+                cache_key = self.image_cache.key(source, type)
+                cached = self.image_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            post_result = json_codec.loads(await self.fetch.upload(f"{self.baseurl}/uploadImage", source, {
+                "sessionKey": self.session_key,
+                "type": type
+            }))
+        result = components.Image(**post_result)
+        if self.image_cache is not None:
+            self.image_cache.put(cache_key, result)
+        return result
 
     @protocol_log
     @edge_case_handler
     async def sendCommand(self, command, *args):
-        return assertOperatorSuccess(await fetch.http_post(f"{self.baseurl}/command/send", {
+        return assertOperatorSuccess(await self.fetch.http_post(f"{self.baseurl}/command/send", {
             "authKey": self.auth_key,
             "name": command,
             "args": args
         }), raise_exception=True, return_as_is=True)
 
     @throw_error_if_not_enable
-    @edge_case_handler
     async def fetchMessage(self, count: int) -> T.List[T.Union[FriendMessage, GroupMessage, ExternalEvent]]:
-        from mirai.event.external.enums import ExternalEvents
-        result = assertOperatorSuccess(
-            await fetch.http_get(f"{self.baseurl}/fetchMessage", {
+        return self.parseReceived(await self.fetchRawMessage(count))
+
+    @throw_error_if_not_enable
+    @edge_case_handler
+    async def fetchRawMessage(self, count: int) -> T.List[dict]:
+        "与 fetchMessage 相同, 但返回未经解析的原始数据."
+        return assertOperatorSuccess(
+            await self.fetch.http_get(f"{self.baseurl}/fetchMessage", {
                 "sessionKey": self.session_key,
                 "count": count
             }
         ), raise_exception=True, return_as_is=True)['data']
+
+    def parseReceived(self, result: T.List[dict]) -> T.List[T.Union[FriendMessage, GroupMessage, ExternalEvent]]:
+        from mirai.event.external.enums import ExternalEvents
         # 因为重新生成一个开销太大, 所以就直接在原数据内进行遍历替换
         try:
             for index in range(len(result)):
                 # 判断当前项是否为 Message
                 if result[index]['type'] in MessageTypes:
                     if 'messageChain' in result[index]: 
-                        result[index]['messageChain'] = MessageChain.parse_obj(result[index]['messageChain'])
+                        result[index]['messageChain'] = MessageChain.lazy(result[index]['messageChain'])
 
                     result[index] = \
                         MessageTypes[result[index]['type']].parse_obj(result[index])
@@ -268,7 +382,7 @@ class MiraiProtocol:
     @protocol_log
     @edge_case_handler
     async def getManagers(self):
-        return assertOperatorSuccess(await fetch.http_get(f"{self.baseurl}/managers"))
+        return assertOperatorSuccess(await self.fetch.http_get(f"{self.baseurl}/managers"))
 
     @throw_error_if_not_enable
     @protocol_log
@@ -277,7 +391,7 @@ class MiraiProtocol:
         if isinstance(sourceId, (components.Source, components.Quote)):
             sourceId = sourceId.id
 
-        result = assertOperatorSuccess(await fetch.http_get(f"{self.baseurl}/messageFromId", {
+        result = assertOperatorSuccess(await self.fetch.http_get(f"{self.baseurl}/messageFromId", {
             "sessionKey": self.session_key,
             "id": sourceId
         }), raise_exception=True, return_as_is=True)
@@ -295,7 +409,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def muteAll(self, group: T.Union[Group, int]) -> bool:
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/muteAll", {
+            await self.fetch.http_post(f"{self.baseurl}/muteAll", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group)
             }
@@ -306,7 +420,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def unmuteAll(self, group: T.Union[Group, int]) -> bool:
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/unmuteAll", {
+            await self.fetch.http_post(f"{self.baseurl}/unmuteAll", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group)
             }
@@ -320,7 +434,7 @@ class MiraiProtocol:
         member: T.Union[Member, int]
     ):
         return MemberChangeableSetting.parse_obj(assertOperatorSuccess(
-            await fetch.http_get(f"{self.baseurl}/memberInfo", {
+            await self.fetch.http_get(f"{self.baseurl}/memberInfo", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
                 "memberId": self.handleTargetAsMember(member)
@@ -344,11 +458,11 @@ class MiraiProtocol:
         setting: MemberChangeableSetting
     ) -> bool:
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/memberInfo", {
+            await self.fetch.http_post(f"{self.baseurl}/memberInfo", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
                 "memberId": self.handleTargetAsMember(member),
-                "info": json.loads(setting.json())
+                "info": json_codec.loads(setting.json())
             }
         ), raise_exception=True)
 
@@ -357,7 +471,7 @@ class MiraiProtocol:
     @edge_case_handler
     async def groupConfig(self, group: T.Union[Group, int]) -> GroupSetting:
         return GroupSetting.parse_obj(
-            await fetch.http_get(f"{self.baseurl}/groupConfig", {
+            await self.fetch.http_get(f"{self.baseurl}/groupConfig", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group)
             })
@@ -371,10 +485,10 @@ class MiraiProtocol:
         config: GroupSetting
     ) -> bool:
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/groupConfig", {
+            await self.fetch.http_post(f"{self.baseurl}/groupConfig", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
-                "config": json.loads(config.json())
+                "config": json_codec.loads(config.json())
             }
         ), raise_exception=True)
 
@@ -390,7 +504,7 @@ class MiraiProtocol:
             time = int(time.total_seconds())
         time = min(86400 * 30, max(60, time))
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/mute", {
+            await self.fetch.http_post(f"{self.baseurl}/mute", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
                 "memberId": self.handleTargetAsMember(member),
@@ -406,7 +520,7 @@ class MiraiProtocol:
         member: T.Union[Member, int]
     ):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/unmute", {
+            await self.fetch.http_post(f"{self.baseurl}/unmute", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
                 "memberId": self.handleTargetAsMember(member),
@@ -422,7 +536,7 @@ class MiraiProtocol:
         kickMessage: T.Optional[str] = None
     ):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/kick", {
+            await self.fetch.http_post(f"{self.baseurl}/kick", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group),
                 "memberId": self.handleTargetAsMember(member),
@@ -439,7 +553,7 @@ class MiraiProtocol:
         group: T.Union[Group, int]
     ):
         return assertOperatorSuccess(
-            await fetch.http_post(f"{self.baseurl}/quit", {
+            await self.fetch.http_post(f"{self.baseurl}/quit", {
                 "sessionKey": self.session_key,
                 "target": self.handleTargetAsGroup(group)
             }
@@ -465,7 +579,7 @@ class MiraiProtocol:
             if not isinstance(operate, (NewFriendRequestResponseOperate, int)):
                 raise TypeError(f"unknown operate: {operate}")
             operate = (operate.value if isinstance(operate, NewFriendRequestResponseOperate) else operate)
-            return assertOperatorSuccess(await fetch.http_post(f"{self.baseurl}/resp/newFriendRequestEvent", {
+            return assertOperatorSuccess(await self.fetch.http_post(f"{self.baseurl}/resp/newFriendRequestEvent", {
                 "sessionKey": self.session_key,
                 "eventId": request.requestId,
                 "fromId": request.supplicant,
@@ -477,7 +591,7 @@ class MiraiProtocol:
             if not isinstance(operate, (MemberJoinRequestResponseOperate, int)):
                 raise TypeError(f"unknown operate: {operate}")
             operate = (operate.value if isinstance(operate, MemberJoinRequestResponseOperate) else operate)
-            return assertOperatorSuccess(await fetch.http_post(f"{self.baseurl}/resp/memberJoinRequestEvent", {
+            return assertOperatorSuccess(await self.fetch.http_post(f"{self.baseurl}/resp/memberJoinRequestEvent", {
                 "sessionKey": self.session_key,
                 "eventId": request.requestId,
                 "fromId": request.supplicant,
@@ -488,109 +602,84 @@ class MiraiProtocol:
         else:
             raise TypeError(f"unknown request: {request}")
 
-    async def handleMessageAsGroup(
+    async def handleMessage(
         self,
         message: T.Union[
             MessageChain,
             BaseMessageComponent,
             T.List[T.Union[BaseMessageComponent, InternalImage]],
             str
-        ]):
+        ],
+        type: str = "group"):
+        "type 为 group, friend 或 temp, 决定图片的上传类型和 imageId 的格式."
         if isinstance(message, MessageChain):
-            return json.loads(message.json())
+            return encode_chain(message)
         elif isinstance(message, BaseMessageComponent):
-            return [json.loads(message.json())]
+            return [encode_component(message)]
         elif isinstance(message, (tuple, list)):
+            asImageId = (lambda image: image.asGroupImage()) if type == "group" else \
+                (lambda image: image.asFriendImage())
             result = []
             for i in message:
                 if isinstance(i, InternalImage):
                     result.append({
                         "type": "Image" if not i.flash else "FlashImage",
-                        "imageId": (await self.handleInternalImageAsGroup(i)).asGroupImage()
+                        "imageId": asImageId(await self.uploadImage(type, i))
                     })
                 elif isinstance(i, components.Image):
                     result.append({
                         "type": "Image",
-                        "imageId": i.asGroupImage()
+                        "imageId": asImageId(i)
                     })
                 elif isinstance(i, components.FlashImage):
                     result.append({
                         "type": "FlashImage",
-                        "imageId": i.asGroupImage()
+                        "imageId": asImageId(i)
                     })
                 else:
-                    result.append(json.loads(i.json()))
+                    result.append(encode_component(i))
             return result
         elif isinstance(message, str):
-            return [json.loads(components.Plain(text=message).json())]
+            return [encode_plain(message)]
         else:
             raise raiser(ValueError("invaild message."))
 
-    async def handleMessageAsFriend(
-        self,
-        message: T.Union[
-            MessageChain,
-            BaseMessageComponent,
-            T.List[BaseMessageComponent],
-            str
-        ]):
-        if isinstance(message, MessageChain):
-            return json.loads(message.json())
-        elif isinstance(message, BaseMessageComponent):
-            return [json.loads(message.json())]
-        elif isinstance(message, (tuple, list)):
-            result = []
-            for i in message:
-                if isinstance(i, InternalImage):
-                    result.append({
-                        "type": "Image" if not i.flash else "FlashImage",
-                        "imageId": (await self.handleInternalImageAsFriend(i)).asFriendImage()
-                    })
-                elif isinstance(i, components.Image):
-                    result.append({
-                        "type": "Image" if not i.flash else "FlashImage",
-                        "imageId": i.asFriendImage()
-                    })
-                else:
-                    result.append(json.loads(i.json()))
-            return result
-        elif isinstance(message, str):
-            return [json.loads(components.Plain(text=message).json())]
-        else:
-            raise raiser(ValueError("invaild message."))
+    async def handleMessageAsGroup(self, message):
+        return await self.handleMessage(message, "group")
 
-    async def handleMessageForTempMessage(
-        self, 
-        message: T.Union[
-            MessageChain,
-            BaseMessageComponent,
-            T.List[BaseMessageComponent],
-            str
-        ]):
-        if isinstance(message, MessageChain):
-            return json.loads(message.json())
-        elif isinstance(message, BaseMessageComponent):
-            return [json.loads(message.json())]
-        elif isinstance(message, (tuple, list)):
-            result = []
-            for i in message:
-                if isinstance(i, InternalImage):
-                    result.append({
-                        "type": "Image" if not i.flash else "FlashImage",
-                        "imageId": (await self.handleInternalImageForTempMessage(i)).asFriendImage()
-                    })
-                elif isinstance(i, components.Image):
-                    result.append({
-                        "type": "Image" if not i.flash else "FlashImage",
-                        "imageId": i.asFriendImage()
-                    })
-                else:
-                    result.append(json.loads(i.json()))
-            return result
-        elif isinstance(message, str):
-            return [json.loads(components.Plain(text=message).json())]
-        else:
-            raise raiser(ValueError("invaild message."))
+    async def handleMessageAsFriend(self, message):
+        return await self.handleMessage(message, "friend")
+
+    async def handleMessageForTempMessage(self, message):
+        return await self.handleMessage(message, "temp")
+
+    async def queueSend(self,
+        target: T.Tuple[str, int],
+        send: T.Callable[[], T.Awaitable],
+        priority: int = 0,
+        coalesceKey: T.Optional[T.Hashable] = None
+    ):
+        "设置了 send_queue 时消息要先经过限速队列, 图片也在轮到发送时才上传, 被合并掉的消息不会上传图片."
+        if self.send_queue is None:
+            return await send()
+        return await self.send_queue.submit(target, send, priority, coalesceKey)
+
+    async def sendWithImageRetry(self, message, type: str, post: T.Callable[[T.List[dict]], T.Awaitable]):
+        """按 type 编码 message 后交给 post 发送.
+
+        imageId 无效或过期时 mirai-api-http 返回 400 (CallDevelopers); 如果消息中用到了缓存的图片,
+        丢弃这些缓存并重新编码 (重新上传图片) 后再发送一次, 仍然失败时抛出异常.
+        网络错误, 禁言等与图片无关的失败不会丢弃缓存, 也不会重试.
+        """
+        messageChain = await self.handleMessage(message, type)
+        try:
+            return await post(messageChain)
+        except exceptions.CallDevelopers:
+            if self.image_cache is None or not self.image_cache.invalidate(
+                    i['imageId'] for i in messageChain if "imageId" in i):
+                raise
+            ProtocolLogger.warning("the server rejected cached images, uploading them again.")
+        return await post(await self.handleMessage(message, type))
 
     def handleTargetAsGroup(self, target: T.Union[Group, int]):
         return target if isinstance(target, int) else \
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import time
+import typing as T
+
+from mirai.logger import Protocol as ProtocolLogger
+
+class TokenBucket:
+    "令牌桶: 每秒补充 rate 个令牌, 最多积攒 burst 个."
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        "距离下一个令牌可用还需要等待的秒数, 为 0 时可以立即取用."
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class _Entry:
+    __slots__ = ("priority", "seq", "target", "send", "coalesce_key", "future", "enqueued")
+
+    def __init__(self, priority, seq, target, send, coalesce_key, future):
+        self.priority = priority
+        self.seq = seq
+        self.target = target
+        self.send = send
+        self.coalesce_key = coalesce_key
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class SendQueue:
+    """发送消息前的限速队列.
+
+    全局, 每个群和每个好友 (临时消息按成员计) 各有一个令牌桶, 消息要同时拿到全局和目标的令牌才会发出.
+    等待中的消息按 priority 从小到大, 相同时按提交顺序发送; 某个目标被限速时不会阻塞其它目标的消息.
+    队列中的消息数达到 maxsize 时, 新的提交会一直等到有空位为止.
+    提交时给出 coalesce_key 且队列中已经有发往同一个目标, 相同 key 的消息还没发出时, 旧消息会被新消息替换,
+    两次提交得到同一个结果, 用来丢弃同一个玩家已经过时的游戏盘图片.
+    """
+    def __init__(self,
+        global_rate: float = 10, global_burst: float = 20,
+        group_rate: float = 2, group_burst: float = 5,
+        friend_rate: float = 2, friend_burst: float = 5,
+        maxsize: int = 1000
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.target_rates = {
+            "group": (group_rate, group_burst),
+            "friend": (friend_rate, friend_burst),
+            "temp": (friend_rate, friend_burst)
+        }
+        self.maxsize = maxsize
+        self.buckets: T.Dict[T.Tuple[str, int], TokenBucket] = {}
+        self.pending: T.List[_Entry] = []
+        # (target, coalesce_key) -> 还没有发出的消息
+        self.coalescing: T.Dict[T.Tuple[T.Tuple[str, int], T.Hashable], _Entry] = {}
+        self.counter = itertools.count()
+        self.sent = 0
+        self.coalesced = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self._changed: T.Optional[asyncio.Condition] = None
+        self._worker: T.Optional[asyncio.Task] = None
+
+    @property
+    def queue_length(self) -> int:
+        return len(self.pending)
+
+    def stats(self) -> dict:
+        "队列长度, 已发送和被合并的消息数, 以及消息在队列中等待的秒数."
+        return {
+            "queue_length": len(self.pending),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "last_wait": self.last_wait,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    async def submit(self,
+        target: T.Tuple[str, int],
+        send: T.Callable[[], T.Awaitable],
+        priority: int = 0,
+        coalesce_key: T.Optional[T.Hashable] = None
+    ):
+        "target 为 (\"group\" | \"friend\" | \"temp\", id), send 是真正发送消息的协程函数."
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self.dispatch())
+
+        if coalesce_key is not None and (target, coalesce_key) in self.coalescing:
+            entry = self.coalescing[(target, coalesce_key)]
+            entry.send = send
+            entry.priority = min(entry.priority, priority)
+            self.coalesced += 1
+            return await asyncio.shield(entry.future)
+
+        async with self._changed:
+            await self._changed.wait_for(lambda: len(self.pending) < self.maxsize)
+            entry = _Entry(
+                priority, next(self.counter), target, send, coalesce_key,
+                asyncio.get_running_loop().create_future()
+            )
+            self.pending.append(entry)
+            if coalesce_key is not None:
+                self.coalescing[(target, coalesce_key)] = entry
+            self._changed.notify_all()
+        return await asyncio.shield(entry.future)
+
+    def bucket(self, target: T.Tuple[str, int]) -> TokenBucket:
+        if target not in self.buckets:
+            if len(self.buckets) > 1024:
+                # 已经攒满令牌的桶与新建的没有区别, 可以丢掉
+                now = time.monotonic()
+                for key in [k for k, v in self.buckets.items() if v.delay(now) == 0 and v.tokens >= v.burst]:
+                    del self.buckets[key]
+            self.buckets[target] = TokenBucket(*self.target_rates[target[0]])
+        return self.buckets[target]
+
+    async def dispatch(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.pending)
+                now = time.monotonic()
+                wait = self.global_bucket.delay(now)
+                chosen = None
+                if not wait:
+                    wait = None
+                    for entry in sorted(self.pending, key=lambda e: (e.priority, e.seq)):
+                        delay = self.bucket(entry.target).delay(now)
+                        if delay == 0:
+                            chosen = entry
+                            break
+                        wait = delay if wait is None else min(wait, delay)
+                if chosen is None:
+                    try:
+                        # 有新消息进来时可能不再需要等待, 所以用带超时的 wait 代替 sleep
+                        await asyncio.wait_for(self._changed.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self.global_bucket.consume()
+                self.bucket(chosen.target).consume()
+                self.pending.remove(chosen)
+                # 已经开始发送的消息不能再被替换
+                if chosen.coalesce_key is not None:
+                    self.coalescing.pop((chosen.target, chosen.coalesce_key), None)
+                self._changed.notify_all()
+            waited = now - chosen.enqueued
+            self.sent += 1
+            self.total_wait += waited
+            self.last_wait = waited
+            self.max_wait = max(self.max_wait, waited)
+            asyncio.ensure_future(self.run(chosen))
+
+    @staticmethod
+    async def run(entry: _Entry):
+        try:
+            result = await entry.send()
+        except Exception as e:
+            if not entry.future.done():
+                entry.future.set_exception(e)
+            ProtocolLogger.error(f"queued message to {entry.target} failed: {e.__class__.__name__}")
+        else:
+            if not entry.future.done():
+                entry.future.set_result(result)
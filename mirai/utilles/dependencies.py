@@ -1,26 +1,31 @@
 """ python-mirai 自带的一些小型依赖注入设施.
 
 各个函数皆返回 mirai.Depend 实例, 不需要进一步的包装.
+相同参数返回的是同一个 Depend, 所以多个处理函数声明的相同依赖在一个事件中只执行一次.
 
 """
 
 from mirai.depend import Depend
 from mirai import MessageChain, Cancelled, Image, Mirai, At, Group
 import re
+from functools import lru_cache
 from typing import List, Union
 
+@lru_cache(maxsize=None)
 def RegexMatch(pattern):
     async def regex_depend_wrapper(message: MessageChain):
         if not re.match(pattern, message.toString()):
             raise Cancelled
     return Depend(regex_depend_wrapper)
 
+@lru_cache(maxsize=None)
 def StartsWith(string):
     async def startswith_wrapper(message: MessageChain):
         if not message.toString().startswith(string):
             raise Cancelled
     return Depend(startswith_wrapper)
 
+@lru_cache(maxsize=None)
 def WithPhoto(num=1):
     "断言消息中图片的数量"
     async def photo_wrapper(message: MessageChain):
@@ -28,23 +33,26 @@ def WithPhoto(num=1):
             raise Cancelled
     return Depend(photo_wrapper)
 
+@lru_cache(maxsize=None)
 def AssertAt(qq=None):
     "断言是否at了某人, 如果没有给出则断言是否at了机器人"
     async def at_wrapper(app: Mirai, message: MessageChain):
         at_set: List[At] = message.getAllofComponent(At)
-        qq = qq or app.qq
-        if at_set:
-            for at in at_set:
-                if at.target == qq:
-                    return
-        else:
-            raise Cancelled
+        target = qq or app.qq
+        for at in at_set:
+            if at.target == target:
+                return
+        raise Cancelled
     return Depend(at_wrapper)
 
 def GroupsRestraint(*groups: List[Union[Group, int]]):
     "断言事件是否发生在某个群内"
+    # Group 不能被哈希, 转换为群号后再按参数缓存
+    return _groups_restraint(frozenset(group if isinstance(group, int) else group.id for group in groups))
+
+@lru_cache(maxsize=None)
+def _groups_restraint(group_ids: frozenset):
     async def gr_wrapper(app: Mirai, group: Group):
-        groups = [group if isinstance(group, int) else group.id for group in groups]
-        if group.id not in groups:
+        if group.id not in group_ids:
             raise Cancelled
     return Depend(gr_wrapper)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import time
+from typing import Optional
+
+from minesweeper import MineSweeper, render_snapshot
+
+
+class RenderPool:
+    """把游戏盘的绘制和图片编码放到线程池或进程池中执行, 避免大游戏盘阻塞事件循环
+
+    提交时先在事件循环里取得游戏盘快照, 之后的绘制不会再读写 MineSweeper 本身,
+    所以进程池模式下只需要传递快照
+
+    每次都从快照完整地绘制一帧, 不支持 MineSweeper 的 incremental_render:
+    保留的上一帧在 26x26 时约 13MB, 为每局游戏保留一帧的内存开销太大, 进程池模式下也无法共享
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, use_process: bool = False,
+                 max_workers: Optional[int] = None):
+        if executor is None:
+            if use_process:
+                executor = ProcessPoolExecutor(max_workers)
+            else:
+                executor = ThreadPoolExecutor(max_workers, thread_name_prefix="render")
+        self.executor = executor
+        self.__pending = 0
+        self.__rendered = 0
+        self.__total_latency = 0.0
+        self.__last_latency = 0.0
+        self.__max_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """已经提交但还没有完成的绘制数"""
+        return self.__pending
+
+    async def render(self, game: MineSweeper, format: str = "jpeg") -> bytes:
+        snapshot = game.snapshot()
+        start = time()
+        self.__pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, render_snapshot, snapshot, format)
+        finally:
+            self.__pending -= 1
+            latency = time() - start
+            self.__rendered += 1
+            self.__total_latency += latency
+            self.__last_latency = latency
+            self.__max_latency = max(self.__max_latency, latency)
+
+    def stats(self) -> dict:
+        """队列深度和每次绘制从提交到完成的耗时 (秒)"""
+        return {
+            "queue_depth": self.__pending,
+            "rendered": self.__rendered,
+            "last_latency": self.__last_latency,
+            "avg_latency": self.__total_latency / self.__rendered if self.__rendered else 0.0,
+            "max_latency": self.__max_latency
+        }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
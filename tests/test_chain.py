@@ -0,0 +1,70 @@
+import unittest
+
+from mirai import MessageChain, Plain, At, AtAll, Face, Image, FlashImage, Quote, Source
+
+
+def raw_chain() -> list:
+    return [
+        {"type": "Source", "id": 1, "time": 0},
+        {
+            "type": "Quote", "id": 7, "groupId": 2, "senderId": 5, "targetId": 2,
+            "origin": [{"type": "Plain", "text": "原消息"}, {"type": "At", "target": 3, "display": "@c"}]
+        },
+        {"type": "At", "target": 1, "display": "@bot"},
+        {"type": "Plain", "text": " 扫雷 "},
+        {"type": "Face", "faceId": 14, "name": "微笑"},
+        {"type": "AtAll"},
+        {"type": "Image", "imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.mirai", "url": None},
+        {"type": "Plain", "text": "a1"}
+    ]
+
+
+class LazyChainTest(unittest.TestCase):
+    "lazy 创建的 MessageChain 与 parse_obj 立即解析的结果一致."
+    def chains(self):
+        # 各自使用一份原始数据, 避免解析时共享同一个列表
+        return MessageChain.lazy(raw_chain()), MessageChain.parse_obj(raw_chain())
+
+    def test_to_string(self):
+        lazy, eager = self.chains()
+        self.assertEqual(lazy.toString(), eager.toString())
+
+    def test_equal(self):
+        lazy, eager = self.chains()
+        self.assertEqual(lazy, eager)
+        self.assertEqual(eager, lazy)
+
+    def test_json(self):
+        lazy, eager = self.chains()
+        self.assertEqual(lazy.json(), eager.json())
+
+    def test_get_first_component(self):
+        lazy, eager = self.chains()
+        for component_class in (Source, Quote, At, AtAll, Plain, Face, Image, FlashImage):
+            self.assertEqual(lazy.getFirstComponent(component_class), eager.getFirstComponent(component_class))
+        self.assertEqual(lazy.getAllofComponent(Plain), eager.getAllofComponent(Plain))
+        self.assertIsNone(lazy.getFirstComponent(FlashImage))
+        # 只查找时不解析整条消息
+        self.assertIsNotNone(lazy._raw)
+
+    def test_add(self):
+        lazy, eager = self.chains()
+        lazy = lazy + Plain(text="b")
+        eager = eager + Plain(text="b")
+        self.assertEqual(lazy, eager)
+        self.assertEqual(lazy.toString(), eager.toString())
+
+        lazy, eager = self.chains()
+        self.assertEqual(eager + MessageChain.lazy(raw_chain()), MessageChain.parse_obj(raw_chain()) + lazy)
+
+    def test_quote_origin(self):
+        lazy, eager = self.chains()
+        origin = lazy.getFirstComponent(Quote).origin
+        self.assertIsInstance(origin, MessageChain)
+        self.assertEqual(origin, eager.getFirstComponent(Quote).origin)
+        self.assertEqual(origin.toString(), eager.getFirstComponent(Quote).origin.toString())
+        self.assertEqual(origin.getFirstComponent(At).target, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
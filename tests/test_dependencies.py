@@ -0,0 +1,40 @@
+import asyncio
+import unittest
+
+from mirai import Mirai, GroupMessage, InternalEvent, MessageChain
+from mirai.utilles.dependencies import StartsWith, GroupsRestraint
+
+
+class DependencyCacheTest(unittest.TestCase):
+    def test_factory_dependency_is_shared_by_handlers(self):
+        app = Mirai(host="127.0.0.1", port=1, authKey="k", qq=1)
+        # event 是类属性, 用自己的字典避免影响其它测试
+        app.event = {}
+        called = []
+
+        @app.receiver("GroupMessage", dependencies=[StartsWith("m"), GroupsRestraint(2)])
+        async def first(message: GroupMessage):
+            called.append("first")
+
+        @app.receiver("GroupMessage", dependencies=[StartsWith("m"), GroupsRestraint(2)])
+        async def second(message: GroupMessage):
+            called.append("second")
+
+        message = GroupMessage.parse_obj({
+            "type": "GroupMessage",
+            "messageChain": MessageChain.lazy([{"type": "Plain", "text": "m show"}]),
+            "sender": {
+                "id": 5, "memberName": "a", "permission": "MEMBER",
+                "group": {"id": 2, "name": "g", "permission": "MEMBER"}
+            }
+        })
+        asyncio.run(app.run_event_bodys(
+            app.build_dispatch_table()["GroupMessage"],
+            InternalEvent(name="GroupMessage", body=message)
+        ))
+        self.assertEqual(called, ["first", "second"])
+        self.assertEqual(app.dependency_stats, {"hits": 2, "misses": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import unittest
+
+from mirai.dispatcher import EventDispatcher
+
+Sender = collections.namedtuple("Sender", "id")
+Body = collections.namedtuple("Body", "sender")
+Context = collections.namedtuple("Context", "name body")
+
+
+def event(sender_id, name: str) -> Context:
+    return Context(name, Body(Sender(sender_id)))
+
+
+class EventDispatcherTest(unittest.TestCase):
+    def test_events_of_same_sender_run_in_order(self):
+        finished = []
+
+        async def run(event_bodys, event_context):
+            # 越早的事件等待越久, 不同发送者的事件可以交错, 同一个发送者的不行
+            await asyncio.sleep(0.001 * (10 - event_bodys))
+            finished.append(event_context.name)
+
+        async def main():
+            dispatcher = EventDispatcher(workers=4)
+            dispatcher.start(run)
+            for index in range(0, 10):
+                await dispatcher.submit(index, event(index % 3, f"{index % 3}-{index}"))
+            while dispatcher.processed < 10:
+                await asyncio.sleep(0.01)
+            dispatcher.close()
+
+        asyncio.run(main())
+        for sender_id in range(0, 3):
+            names = [name for name in finished if name.startswith(f"{sender_id}-")]
+            self.assertEqual(names, [f"{sender_id}-{index}" for index in range(sender_id, 10, 3)])
+
+    def test_at_most_workers_events_run_at_once(self):
+        running = 0
+        most = 0
+
+        async def run(event_bodys, event_context):
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        async def main():
+            dispatcher = EventDispatcher(workers=3)
+            dispatcher.start(run)
+            for index in range(0, 20):
+                # 一半按发送者分片, 一半没有发送者轮流分配
+                await dispatcher.submit(index, event(index if index % 2 else None, str(index)))
+            while dispatcher.processed < 20:
+                await asyncio.sleep(0.01)
+            dispatcher.close()
+
+        asyncio.run(main())
+        self.assertEqual(most, 3)
+
+    def test_shed_oldest_only_drops_same_sender(self):
+        finished = []
+
+        async def main():
+            gate = asyncio.Event()
+
+            async def run(event_bodys, event_context):
+                await gate.wait()
+                finished.append(event_context.name)
+
+            dispatcher = EventDispatcher(workers=1, queue_size=3, overflow="shed_oldest")
+            dispatcher.start(run)
+            # 第一个事件被 worker 取出后阻塞, 之后的事件留在队列里
+            await dispatcher.submit(None, event("a", "a0"))
+            while dispatcher.depths[0]:
+                await asyncio.sleep(0)
+            for name in ("a1", "b1", "a2"):
+                self.assertTrue(await dispatcher.submit(None, event(name[0], name)))
+            self.assertTrue(await dispatcher.submit(None, event("a", "a3")))
+            # c 没有排队的事件, 不会挤掉别人的事件, 新事件被丢弃
+            self.assertFalse(await dispatcher.submit(None, event("c", "c1")))
+            self.assertEqual(dispatcher.stats()["shed"], 1)
+            self.assertEqual(dispatcher.stats()["dropped"], 1)
+            gate.set()
+            while dispatcher.processed < 4:
+                await asyncio.sleep(0.01)
+            dispatcher.close()
+
+        asyncio.run(main())
+        self.assertEqual(finished, ["a0", "b1", "a2", "a3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
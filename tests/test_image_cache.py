@@ -0,0 +1,84 @@
+import asyncio
+import json
+import unittest
+
+from aiohttp import web
+
+from mirai import Mirai, Image
+
+
+class StubServer:
+    "假的 mirai-api-http, 每次上传返回新的 imageId, reject 中的 imageId 出现在消息里时返回 400."
+    def __init__(self):
+        self.uploads = 0
+        self.sent = []
+        self.reject = set()
+
+    async def upload(self, request: web.Request):
+        await request.post()
+        self.uploads += 1
+        image_id = "{%08d-0000-0000-0000-000000000000}.mirai" % self.uploads
+        return web.json_response({"imageId": image_id, "url": "http://example.com/image"})
+
+    async def send(self, request: web.Request):
+        body = json.loads(await request.read())
+        image_ids = [i["imageId"] for i in body["messageChain"] if "imageId" in i]
+        self.sent.append(image_ids)
+        if self.reject.intersection(image_ids):
+            return web.json_response({"code": 400, "msg": "wrong arguments"})
+        return web.json_response({"code": 0, "msg": "success", "messageId": len(self.sent)})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/uploadImage", self.upload)
+        app.router.add_post("/sendGroupMessage", self.send)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return f"127.0.0.1:{self.runner.addresses[0][1]}"
+
+
+class ImageCacheTest(unittest.TestCase):
+    def run_with_stub(self, scenario):
+        stub = StubServer()
+
+        async def main():
+            location = await stub.start()
+            try:
+                app = Mirai(f"mirai://{location}/?authKey=k&qq=1")
+                app.enabled = True
+                app.session_key = "SK"
+                await scenario(app, stub)
+            finally:
+                await stub.runner.cleanup()
+        asyncio.run(main())
+        return stub
+
+    def test_same_image_is_uploaded_once(self):
+        async def scenario(app: Mirai, stub: StubServer):
+            for _ in range(0, 3):
+                await app.sendGroupMessage(1, [Image.fromBytes(b"panel")])
+            self.assertEqual(app.image_cache.stats()["hits"], 2)
+
+        stub = self.run_with_stub(scenario)
+        self.assertEqual(stub.uploads, 1)
+        self.assertEqual(len(stub.sent), 3)
+
+    def test_rejected_image_is_uploaded_again(self):
+        async def scenario(app: Mirai, stub: StubServer):
+            await app.sendGroupMessage(1, [Image.fromBytes(b"panel")])
+            # 服务端不再接受第一次上传得到的 imageId
+            stub.reject.update(stub.sent[0])
+            result = await app.sendGroupMessage(1, [Image.fromBytes(b"panel")])
+            self.assertEqual(result.messageId, 3)
+            self.assertEqual(app.image_cache.stats()["size"], 1)
+
+        stub = self.run_with_stub(scenario)
+        self.assertEqual(stub.uploads, 2)
+        self.assertEqual(stub.sent[1], stub.sent[0])
+        self.assertNotEqual(stub.sent[2], stub.sent[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
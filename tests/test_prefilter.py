@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from mirai import Mirai, GroupMessage
+
+
+def group_message(text: str) -> dict:
+    return {
+        "type": "GroupMessage",
+        "messageChain": [{"type": "Source", "id": 1, "time": 0}, {"type": "Plain", "text": text}],
+        "sender": {
+            "id": 5, "memberName": "a", "permission": "MEMBER",
+            "group": {"id": 2, "name": "g", "permission": "MEMBER"}
+        }
+    }
+
+
+def make_app() -> Mirai:
+    app = Mirai(host="127.0.0.1", port=1, authKey="k", qq=1)
+    # event 是类属性, 每个测试用自己的字典, 避免处理函数在测试之间共享
+    app.event = {}
+    return app
+
+
+class PreFilterTest(unittest.TestCase):
+    def run_polled(self, app: Mirai, raw: list) -> list:
+        "把原始事件交给 dispatch_polled, 再执行放入队列的事件, 返回被调用的处理函数的名字."
+        called = []
+
+        async def main():
+            app.queue = asyncio.Queue()
+            batches = asyncio.Queue()
+            batches.put_nowait(raw)
+            dispatcher = asyncio.ensure_future(app.dispatch_polled(batches))
+            while app.queue.qsize() < len(raw) and not dispatcher.done():
+                await asyncio.sleep(0)
+            dispatcher.cancel()
+            while not app.queue.empty():
+                event_context, event_bodys = app.queue.get_nowait()
+                await app.run_event_bodys(event_bodys, event_context)
+
+        app.receiver("GroupMessage")(self.recorder(called, "plain"))
+        app.receiver("GroupMessage", pre_filter=lambda raw: False)(self.recorder(called, "rejected"))
+        app.receiver("GroupMessage", pre_filter=lambda raw: True)(self.recorder(called, "accepted"))
+        asyncio.run(main())
+        return called
+
+    @staticmethod
+    def recorder(called: list, name: str):
+        async def receiver(message: GroupMessage):
+            called.append(name)
+        return receiver
+
+    def test_rejected_receiver_is_skipped(self):
+        app = make_app()
+        self.assertEqual(self.run_polled(app, [group_message("hello")]), ["plain", "accepted"])
+        self.assertEqual(app.prefilter_stats, {"passed": 1, "dropped": 0, "skipped": 1})
+
+    def test_event_rejected_by_all_receivers_is_dropped(self):
+        app = make_app()
+        app.receiver("FriendMessage", pre_filter=lambda raw: False)(self.recorder([], "friend"))
+        self.assertEqual(app.prefilter({"type": "FriendMessage"}), ())
+        self.assertEqual(app.prefilter({"type": "BotOnlineEvent"}), ())
+        self.assertEqual(app.prefilter_stats["dropped"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import time
+import unittest
+
+from mirai.ratelimit import SendQueue
+
+
+def sender(sent: list, value, error: Exception = None):
+    "返回一个发送函数, 被调用时记录 value 和调用时间."
+    async def send():
+        sent.append((value, time.monotonic()))
+        if error is not None:
+            raise error
+        return value
+    return send
+
+
+class SendQueueTest(unittest.TestCase):
+    def test_target_is_paced_by_rate_and_burst(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=1000, global_burst=1000, group_rate=20, group_burst=2)
+            start = time.monotonic()
+            await asyncio.gather(*[queue.submit(("group", 1), sender(sent, i)) for i in range(0, 6)])
+            return start
+
+        start = asyncio.run(main())
+        offsets = [at - start for _, at in sent]
+        self.assertEqual([value for value, _ in sent], list(range(0, 6)))
+        # 前 burst 条立即发出, 之后每 1 / rate 秒一条
+        self.assertLess(offsets[1], 0.03)
+        self.assertGreater(offsets[5], 4 / 20 - 0.02)
+        self.assertLess(offsets[5], 0.5)
+
+    def test_throttled_target_does_not_block_others(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=1000, global_burst=1000, group_rate=1, group_burst=1)
+            await queue.submit(("group", 1), sender(sent, "first"))
+            throttled = asyncio.ensure_future(queue.submit(("group", 1), sender(sent, "throttled")))
+            await asyncio.wait_for(queue.submit(("group", 2), sender(sent, "other")), 0.3)
+            self.assertFalse(throttled.done())
+            throttled.cancel()
+
+        asyncio.run(main())
+        self.assertEqual([value for value, _ in sent], ["first", "other"])
+
+    def test_pending_messages_are_sent_by_priority(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=20, global_burst=1)
+            # 用掉唯一的令牌, 之后提交的消息都要排队
+            await queue.submit(("group", 1), sender(sent, "blocker"))
+            await asyncio.gather(*[
+                queue.submit(("group", target), sender(sent, priority), priority=priority)
+                for target, priority in enumerate((5, 1, 3, 0))
+            ])
+
+        asyncio.run(main())
+        self.assertEqual([value for value, _ in sent], ["blocker", 0, 1, 3, 5])
+
+    def test_full_queue_blocks_submitters(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=10, global_burst=1, maxsize=2)
+            await queue.submit(("group", 1), sender(sent, "blocker"))
+            tasks = [asyncio.ensure_future(queue.submit(("group", i), sender(sent, i))) for i in range(0, 3)]
+            await asyncio.sleep(0.02)
+            self.assertEqual(queue.queue_length, 2)
+            self.assertEqual(sum(task.done() for task in tasks), 0)
+            self.assertEqual(await asyncio.gather(*tasks), [0, 1, 2])
+
+        asyncio.run(main())
+
+    def test_coalesced_submitters_get_the_newest_result(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=20, global_burst=1)
+            await queue.submit(("group", 1), sender(sent, "blocker"))
+            results = await asyncio.gather(
+                queue.submit(("group", 1), sender(sent, "old"), coalesce_key="panel"),
+                queue.submit(("group", 1), sender(sent, "new"), coalesce_key="panel")
+            )
+            self.assertEqual(results, ["new", "new"])
+            self.assertEqual(queue.stats()["coalesced"], 1)
+
+        asyncio.run(main())
+        self.assertEqual([value for value, _ in sent], ["blocker", "new"])
+
+    def test_same_key_is_not_coalesced_across_targets(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=20, global_burst=1)
+            await queue.submit(("group", 1), sender(sent, "blocker"))
+            results = await asyncio.gather(
+                queue.submit(("group", 1), sender(sent, "to 1"), coalesce_key="panel"),
+                queue.submit(("group", 2), sender(sent, "to 2"), coalesce_key="panel")
+            )
+            self.assertEqual(results, ["to 1", "to 2"])
+            self.assertEqual(queue.stats()["coalesced"], 0)
+            # 每条消息都只消耗自己目标的令牌
+            self.assertLess(queue.buckets[("group", 1)].tokens, queue.buckets[("group", 1)].burst - 1.5)
+            self.assertLess(queue.buckets[("group", 2)].tokens, queue.buckets[("group", 2)].burst - 0.5)
+
+        asyncio.run(main())
+        self.assertEqual(sorted(value for value, _ in sent), ["blocker", "to 1", "to 2"])
+
+    def test_exception_reaches_every_waiter(self):
+        sent = []
+
+        async def main():
+            queue = SendQueue(global_rate=20, global_burst=1)
+            await queue.submit(("group", 1), sender(sent, "blocker"))
+            return await asyncio.gather(
+                queue.submit(("group", 1), sender(sent, "old"), coalesce_key="panel"),
+                queue.submit(("group", 1), sender(sent, "new", RuntimeError("boom")), coalesce_key="panel"),
+                return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        self.assertEqual([type(result) for result in results], [RuntimeError, RuntimeError])
+        self.assertEqual([value for value, _ in sent], ["blocker", "new"])
+
+
+if __name__ == '__main__':
+    unittest.main()